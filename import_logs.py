@@ -0,0 +1,239 @@
+import argparse
+import ast
+import glob
+import os
+import re
+from typing import Dict, Iterator, List
+
+import metrics
+import results_store
+
+# Перенос старых vN_pytest_log.txt / vN_metrics_log.txt в хранилище результатов.
+# Логи читаются построчно; каждая пара (модель, версия) становится одним прогоном
+# с source='log', даже если есть только один из двух логов.
+
+LOG_RE = re.compile(r'(?:^|/)(v\d+)_(pytest|metrics)_log\.txt$')
+
+# pytest -q: итоговые строки short test summary и сводка
+FAILED_RE = re.compile(r'^(FAILED|ERROR) (\S+)(?: - (.*))?$')
+SUMMARY_RE = re.compile(r'^=*\s*(\d+ \w+.*) in ([\d.]+)s')
+SUMMARY_COUNT_RE = re.compile(r'(\d+) (passed|failed|skipped|errors?|xfailed|xpassed)')
+
+# Строки вывода metrics.py; вывод flaky и pylint в старых логах бывает склеен в одну строку
+METRIC_RES = {
+    "style": re.compile(r'Style Score:\s*([\d.]+)/10'),
+    "pass_rate": re.compile(r'Pass Rate:\s*(\d+)/(\d+)'),
+    "full": re.compile(r'^API Endpoint Coverage:\s*(\d+)/(\d+)'),
+    "partly": re.compile(r'API partly Endpoint Coverage\s*[:\s]\s*(\d+)/(\d+)'),
+    "undeclared": re.compile(r'Незаявленные статус-коды:\s*(\d+)\s*/\s*(\d+)'),
+    "endpoint_avg": re.compile(r'Средний процент покрытия по endpoint:\s*([\d.]+)%'),
+    "flaky": re.compile(r'Flaky tests:\s*(\[[^\]]*\])'),
+    "complexity": re.compile(r'Cyclomatic complexity:\s*(\d+)'),
+    "length": re.compile(r'Средняя длина теста:\s*([\d.]+) строк, средняя сложность:\s*([\d.]+)'),
+    "requests": re.compile(r'Запросов на тест:\s*([\d.]+) \(максимум (\d+)\)'),
+}
+SECTION_RE = re.compile(r'^  - (\w+): ([\d.]+)%$')
+CASE_RE = re.compile(r'^\s+- (\S+) (\S+): получили (\S+), ожидали \[(.*)\]$')
+ITEM_RE = re.compile(r'^\s+- (\S+)$')
+
+# Заголовки списков в логе metrics.py -> ключ записи
+LIST_HEADERS = {
+    "Средний процент покрытия по разделам:": "section_coverage",
+    "Список незаявленных случаев:": "undeclared_cases",
+    "Список скорректированных тестов:": "adjusted",
+    "Список подозрительных тестов:": "suspicious",
+}
+
+
+def read_lines(path: str) -> Iterator[str]:
+    # utf-8-sig: часть логов сохранена с BOM
+    with open(path, encoding='utf-8-sig', errors='replace') as f:
+        for line in f:
+            yield line.rstrip('\n')
+
+
+def percent(part: int, total: int) -> float:
+    return part / total * 100 if total else 0.0
+
+
+def failure_category(message: str | None) -> str:
+    # Те же категории, что у metrics.classify_report, по тексту assert из строки FAILED
+    adjusted, suspicious_4xx, suspicious_5xx = metrics.classify_status_assert(message or "")
+    if adjusted:
+        return "adjusted"
+    return "suspicious" if suspicious_4xx or suspicious_5xx else "failed"
+
+
+def parse_pytest_log(path: str) -> dict:
+    """
+    Упавшие тесты (с текстом assert и категорией) и сводка pytest. Прошедшие тесты
+    в логе -q видны только точками, поэтому поимённо записываются лишь FAILED/ERROR.
+    Pass rate считается, как в metrics.py: скорректированные падения — пройденные.
+    """
+    outcomes: Dict[str, dict] = {}
+    summary: Dict[str, int] = {}
+    duration = None
+    for line in read_lines(path):
+        m = FAILED_RE.match(line)
+        if m:
+            outcomes[m.group(2)] = {"outcome": "failed" if m.group(1) == "FAILED" else "error",
+                                    "duration": None, "category": failure_category(m.group(3)),
+                                    "message": m.group(3)}
+            continue
+        m = SUMMARY_RE.match(line)
+        if m:
+            summary = {kind.rstrip("s") if kind.startswith("error") else kind: int(n)
+                       for n, kind in SUMMARY_COUNT_RE.findall(m.group(1))}
+            duration = float(m.group(2))
+    record = {"outcomes": outcomes, "pytest_summary": summary, "duration": duration}
+    if summary:
+        adjusted = [nodeid for nodeid, t in outcomes.items() if t["category"] == "adjusted"]
+        tests = sum(summary.values())
+        passed = summary.get("passed", 0) + len(adjusted)
+        record.update({
+            "tests": tests,
+            "passed": passed,
+            "failed": tests - passed,
+            "pass_rate": percent(passed, tests),
+            "adjusted": adjusted,
+            "suspicious": [nodeid for nodeid, t in outcomes.items() if t["category"] == "suspicious"],
+        })
+    return record
+
+
+def parse_metrics_log(path: str) -> dict:
+    """Метрики, таблица покрытия и списки тестов из текстового отчёта metrics.py."""
+    record: dict = {"section_coverage": {}, "undeclared_cases": [], "adjusted": [],
+                    "suspicious": [], "coverage_table": []}
+    headers: List[str] = []
+    current = None
+    for line in read_lines(path):
+        stripped = line.strip()
+        header = next((key for title, key in LIST_HEADERS.items() if stripped.endswith(title)), None)
+        if header:
+            current = header
+            continue
+        if stripped.startswith("METHOD |"):
+            headers = [h.strip() for h in stripped.split("|")]
+            current = "coverage_table"
+            continue
+        if current == "coverage_table":
+            cells = [c.strip() for c in line.split("|")]
+            if len(cells) == len(headers) and not set(cells[0]) <= {"-"}:
+                row = dict(zip(["method", "path", "Specification", "Expected", "missing", "coverage_pct"], cells))
+                row["coverage_pct"] = float(row["coverage_pct"].rstrip("%"))
+                record["coverage_table"].append(row)
+                continue
+            if not set(stripped) <= set("-| "):
+                current = None
+        elif current == "section_coverage" and SECTION_RE.match(line):
+            m = SECTION_RE.match(line)
+            record["section_coverage"][m.group(1)] = float(m.group(2))
+            continue
+        elif current == "undeclared_cases" and CASE_RE.match(line):
+            m = CASE_RE.match(line)
+            declared = "" if m.group(4) == "-" else m.group(4)
+            record["undeclared_cases"].append({"method": m.group(1), "path": m.group(2),
+                                               "code": m.group(3), "declared": declared})
+            continue
+        elif current in ("adjusted", "suspicious") and ITEM_RE.match(line):
+            record[current].append(ITEM_RE.match(line).group(1))
+            continue
+        elif stripped:
+            current = None
+
+        for key, regex in METRIC_RES.items():
+            m = regex.search(line)
+            if not m:
+                continue
+            if key == "style":
+                record["style_score"] = float(m.group(1))
+            elif key == "pass_rate":
+                record["passed"], record["tests"] = int(m.group(1)), int(m.group(2))
+                record["failed"] = record["tests"] - record["passed"]
+                record["pass_rate"] = percent(record["passed"], record["tests"])
+            elif key == "full":
+                record["fully_covered"], record["endpoints"] = int(m.group(1)), int(m.group(2))
+                record["endpoint_coverage"] = percent(record["fully_covered"], record["endpoints"])
+            elif key == "partly":
+                record["partly_covered"] = int(m.group(1))
+                record["partly_endpoint_coverage"] = percent(int(m.group(1)), int(m.group(2)))
+            elif key == "undeclared":
+                record["undeclared_count"] = int(m.group(1))
+                record["undeclared_status_codes"] = percent(int(m.group(1)), int(m.group(2)) or 1)
+            elif key == "endpoint_avg":
+                record["endpoint_avg_coverage"] = float(m.group(1))
+            elif key == "flaky":
+                try:
+                    names = ast.literal_eval(m.group(1))
+                except (ValueError, SyntaxError):
+                    names = []
+                record["flaky_tests"] = [name for name in names if name != "None"]
+            elif key == "complexity":
+                record["cyclomatic_complexity"] = int(m.group(1))
+            elif key == "length":
+                record["avg_test_length"], record["avg_complexity"] = float(m.group(1)), float(m.group(2))
+            elif key == "requests":
+                record["avg_requests_per_test"] = float(m.group(1))
+                record["max_requests_per_test"] = int(m.group(2))
+    return record
+
+
+def build_record(suite: str, pytest_log: str | None, metrics_log: str | None) -> dict:
+    """Запись в формате metrics.evaluate_file по одному или обоим логам версии."""
+    record: dict = {"file": suite, "model": os.path.basename(os.path.dirname(suite)), "started": None}
+    if pytest_log:
+        record.update(parse_pytest_log(pytest_log))
+    if metrics_log:
+        metrics = parse_metrics_log(metrics_log)
+        record.update(metrics)
+        # Категории упавших тестов — по спискам отчёта metrics.py
+        outcomes = record.setdefault("outcomes", {})
+        for category in ("adjusted", "suspicious"):
+            for nodeid in metrics[category]:
+                outcomes.setdefault(nodeid, {"outcome": "failed", "duration": None,
+                                             "message": None})["category"] = category
+    return record
+
+
+def group_logs(paths: List[str]) -> Dict[str, Dict[str, str]]:
+    # Grok/v6_pytest_log.txt -> {"Grok/v6_main.py": {"pytest": ...}}
+    groups: Dict[str, Dict[str, str]] = {}
+    for path in sorted(paths):
+        m = LOG_RE.search(path.replace(os.sep, "/"))
+        if m:
+            suite = os.path.join(os.path.dirname(path), f"{m.group(1)}_main.py")
+            groups.setdefault(suite, {})[m.group(2)] = path
+    return groups
+
+
+def import_logs(pattern: str, db_path: str = results_store.RESULTS_DB, force: bool = False) -> int:
+    """
+    Импортирует логи по glob-шаблону. Версии, уже импортированные из логов,
+    пропускаются (force=True — добавить ещё раз). Возвращает число новых прогонов.
+    """
+    groups = group_logs(glob.glob(pattern))
+    conn = results_store.connect(db_path)
+    imported = 0
+    try:
+        for suite, logs in groups.items():
+            if not force and conn.execute(
+                    "SELECT 1 FROM runs WHERE source = 'log' AND file = ?", (suite,)).fetchone():
+                continue
+            record = build_record(suite, logs.get("pytest"), logs.get("metrics"))
+            run_id = results_store.record_run(conn, record, source="log")
+            imported += 1
+            print(f"📥 {suite} ({', '.join(sorted(logs))}) -> run {run_id}")
+    finally:
+        conn.close()
+    return imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт старых логов pytest и metrics.py в хранилище результатов")
+    parser.add_argument("pattern", nargs="?", default="*/v*_log.txt", help="glob-шаблон логов")
+    parser.add_argument("--results-db", default=results_store.RESULTS_DB, help="SQLite-хранилище результатов")
+    parser.add_argument("--force", action="store_true", help="Импортировать повторно уже импортированные версии")
+    args = parser.parse_args()
+    count = import_logs(args.pattern, args.results_db, args.force)
+    print(f"Импортировано прогонов: {count}")
@@ -3,18 +3,34 @@ import json
 import re
 import os
 import tempfile
+import hashlib
+import sys
+import time
+import argparse
+import glob
+import linecache
+import multiprocessing
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import AbstractContextManager, nullcontext, redirect_stdout
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
 from typing import List, Set, Tuple, Dict
 import ast
+import pytest
 import requests
 import yaml
+import numpy as np
 import html
 from io import StringIO
-from radon.visitors import ComplexityVisitor
+from pylint import __version__ as pylint_version
+from pylint.config import find_default_config_files
 from pylint.lint import Run
 from pylint.reporters.text import TextReporter
+from _pytest.runner import runtestprotocol
+import results_store
 
-# pip install radon pylint requests pyyaml pytest-json-report
+# pip install pylint requests pyyaml pytest-json-report numpy
 
 # Файл с тестами (обязательно .py)
 TEST_FILEs = ["Grok/v1_main.py"]
@@ -33,10 +49,31 @@ ENDPOINTS = [
 
 ACCEPTABLE_CODES = [400, 401, 403, 404, 405, 409, 415, 422]
 
-def run_pytest_json(test_name: str = None, report_file: str = "report.json") -> dict:
+# Тёплый пул: форк-сервер заранее импортирует metrics, pytest, requests и urllib3,
+# каждый запуск pytest получает свежий процесс форком от него
+USE_WARM_POOL = False
+WARM_PRELOAD = ["pytest", "_pytest.runner", "requests", "urllib3"]
+# Процесс, импортировавший модуль: в форке прогретого форк-сервера — сам форк-сервер
+LOADED_PID = os.getpid()
+# Пулы warm_pool по числу воркеров, создаются один раз на процесс
+_WARM_POOLS: Dict[int, ProcessPoolExecutor] = {}
+
+# Кэш вердиктов flaky-тестов по AST-хэшу теста и его зависимостей
+# (по файлу на хэш: параллельные batch-воркеры не перезаписывают чужие вердикты)
+FLAKY_CACHE_DIR = ".metrics_cache/flaky"
+# Сохранённые отчёты прогонов для инкрементальной переоценки версий
+REPORT_STATE_DIR = ".metrics_cache/reports"
+# Оценки pylint по sha256 файла и конфигурации pylint, по файлу на запись
+STYLE_CACHE_DIR = ".metrics_cache/style"
+PYLINT_ARGS = ['--score=yes']
+# Локальные копии спецификаций: index.json (base URL -> хэш) и файлы <sha256>.raw / <sha256>.json
+SPEC_CACHE_DIR = ".metrics_cache/specs"
+
+def run_pytest_json(test_name: str = None, report_file: str = "report.json", module_path: str = None) -> dict:
+    module_path = module_path or TEST_FILE
     cmd = [
         "pytest",
-        TEST_FILE if not test_name else f"{TEST_FILE}::{test_name}",
+        module_path if not test_name else f"{module_path}::{test_name}",
         "--json-report",
         f"--json-report-file={report_file}",
         "--maxfail=0"
@@ -55,6 +92,487 @@ def run_pytest_json(test_name: str = None, report_file: str = "report.json") ->
         return {}
 
 
+def inprocess_pytest_args(*targets: str) -> List[str]:
+    # importlib-режим: одноимённые vN_main.py из разных папок не конфликтуют в sys.modules
+    return [
+        *targets,
+        "-p", "no:terminal",
+        "-p", "no:cacheprovider",
+        "--import-mode=importlib",
+    ]
+
+
+def pytest_main_isolated(targets: List[str], plugins: list) -> int:
+    """
+    pytest.main по targets (файл или файл::тест) в текущем процессе, с аргументами
+    inprocess_pytest_args. Модули тестов, которые импортировала сессия
+    (файлы тестов, conftest.py и локальные модули из их каталогов), затем
+    удаляются из sys.modules: следующая сессия импортирует их заново, и состояние
+    уровня модуля не переходит из прогона в прогон, как и с отдельным интерпретатором.
+    """
+    dirs = {os.path.dirname(os.path.abspath(target.split("::")[0])) for target in targets}
+    before = set(sys.modules)
+    try:
+        return int(pytest.main(inprocess_pytest_args(*targets), plugins=plugins))
+    finally:
+        for name in set(sys.modules) - before:
+            path = getattr(sys.modules[name], "__file__", None)
+            if path and "site-packages" not in path and os.path.dirname(os.path.abspath(path)) in dirs:
+                del sys.modules[name]
+
+
+def is_status_code(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and 100 <= value <= 599
+
+
+class ReportCollector:
+    """
+    pytest-плагин, собирающий отчёт в памяти в формате pytest-json-report:
+    {"tests": [{"nodeid", "outcome", "duration", "setup", "call", "teardown"}], "summary": {...}}.
+    У каждого теста есть ключ "call" (при ошибке setup туда попадает её longrepr).
+    Если тест упал на assert-е над status_code, этот assert записывается структурно
+    в "status_asserts" как [левый операнд, оператор, правый операнд], и текст
+    traceback не хранится. Прочие падения (в том числе сравнения id и счётчиков
+    из того же диапазона чисел) сохраняют longrepr.
+    """
+
+    def __init__(self):
+        self.tests: Dict[str, dict] = {}
+        self.collectors: List[dict] = []
+        # nodeid -> упавшие сравнения кодов: (левый, оператор, правый, текст как в reprcrash)
+        self.status_asserts: Dict[str, List[tuple]] = defaultdict(list)
+        self.nodeid: str | None = None
+
+    def pytest_runtest_logstart(self, nodeid, location):
+        self.nodeid = nodeid
+        self.status_asserts.pop(nodeid, None)
+
+    def pytest_assertrepr_compare(self, config, op, left, right):
+        # Вызывается pytest для каждого упавшего сравнения в переписанном assert;
+        # сообщение не меняем (возвращаем None)
+        if self.nodeid is None or op not in ("==", "!=", "in", "not in") or not is_status_code(left):
+            return None
+        text = f"assert {left!r} {op} {right!r}"
+        if op in ("in", "not in"):
+            if not isinstance(right, (list, tuple, set, frozenset)) or not all(map(is_status_code, right)):
+                return None
+            right = tuple(sorted(right) if isinstance(right, (set, frozenset)) else right)
+        elif not is_status_code(right):
+            return None
+        self.status_asserts[self.nodeid].append((left, op, right, text))
+        return None
+
+    def crash_status_assert(self, report) -> list | None:
+        """
+        Записанное сравнение, на котором тест действительно упал: его текст есть
+        в reprcrash, а в строке падения проверяется status_code. Сравнения,
+        пойманные try/except внутри теста, сюда не попадают.
+        """
+        asserts = self.status_asserts.pop(report.nodeid, [])
+        crash = getattr(report.longrepr, "reprcrash", None)
+        if not asserts or crash is None or "status_code" not in linecache.getline(crash.path, crash.lineno):
+            return None
+        lines = {line.strip() for line in crash.message.splitlines()}
+        for left, op, right, text in reversed(asserts):
+            if text in lines:
+                return [left, op, right]
+        return None
+
+    def pytest_collectreport(self, report):
+        if report.failed:
+            self.collectors.append({"nodeid": report.nodeid, "outcome": "failed",
+                                    "longrepr": report.longreprtext})
+
+    def pytest_runtest_logreport(self, report):
+        test = self.tests.setdefault(report.nodeid, {
+            "nodeid": report.nodeid,
+            "outcome": "passed",
+            "duration": 0.0,
+        })
+        stage = {"duration": report.duration, "outcome": report.outcome}
+        status_assert = self.crash_status_assert(report) if report.when == "call" and report.failed else None
+        if status_assert:
+            test["status_asserts"] = [status_assert]
+        elif report.longrepr:
+            stage["longrepr"] = report.longreprtext
+            crash = getattr(report.longrepr, "reprcrash", None)
+            if crash is not None:
+                # Как "crash" в pytest-json-report
+                stage["crash"] = {"path": crash.path, "lineno": crash.lineno, "message": crash.message}
+        test[report.when] = stage
+        test["duration"] += report.duration
+
+        if report.when == "call":
+            test["outcome"] = "xfailed" if hasattr(report, "wasxfail") and report.skipped else report.outcome
+        elif report.failed:
+            # Падение setup/teardown pytest-json-report помечает как error
+            test["outcome"] = "error"
+        elif report.skipped and report.when == "setup":
+            test["outcome"] = "skipped"
+
+        if report.when == "teardown":
+            if "call" not in test:
+                test["call"] = {"duration": 0.0, "outcome": test["outcome"],
+                                "longrepr": test.get("setup", {}).get("longrepr", "")}
+                if "crash" in test.get("setup", {}):
+                    test["call"]["crash"] = test["setup"]["crash"]
+
+    def report(self, exitcode: int) -> dict:
+        tests = list(self.tests.values())
+        summary: Dict[str, int] = defaultdict(int)
+        for t in tests:
+            summary[t["outcome"]] += 1
+        summary["total"] = summary["collected"] = len(tests)
+        return {"exitcode": exitcode, "summary": dict(summary),
+                "collectors": self.collectors, "tests": tests}
+
+
+class HttpCapture:
+    """
+    pytest-плагин: на время прогона подменяет requests.Session.send и записывает
+    каждый реальный запрос как [METHOD, путь без BASE_URL, статус, время в секундах]
+    в таблицу calls[nodeid]. Через Session.send проходят и requests.get(...),
+    и вызовы через сессии и вспомогательные функции.
+    """
+
+    def __init__(self):
+        self.calls: Dict[str, List[list]] = defaultdict(list)
+        self.nodeid: str | None = None
+        self.original_send = None
+
+    def pytest_sessionstart(self, session):
+        self.original_send = requests.Session.send
+        original_send, capture = self.original_send, self
+        base_path = urlsplit(BASE_URL).path.rstrip('/')
+
+        def send(session_self, request, **kwargs):
+            response = original_send(session_self, request, **kwargs)
+            if capture.nodeid is not None:
+                path = url_path(request.url, base_path) or '/'
+                capture.calls[capture.nodeid].append([
+                    request.method.upper(), path, str(response.status_code),
+                    round(response.elapsed.total_seconds(), 4),
+                ])
+            return response
+
+        requests.Session.send = send
+
+    def pytest_sessionfinish(self, session):
+        if self.original_send is not None:
+            requests.Session.send = self.original_send
+            self.original_send = None
+
+    def pytest_runtest_logstart(self, nodeid, location):
+        self.nodeid = nodeid
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        self.nodeid = None
+
+
+def run_pytest_inprocess(test_name: str = None, module_path: str = None,
+                         test_names: List[str] = None) -> dict:
+    """
+    Запускает pytest в текущем процессе и возвращает отчёт той же структуры,
+    что и run_pytest_json, без подпроцесса, файла report.json и pytest-json-report.
+    Дополнительно у каждого теста есть "http" — запросы, записанные HttpCapture.
+    test_names — запустить только перечисленные тесты (в порядке файла).
+    """
+    module_path = module_path or TEST_FILE
+    if test_names:
+        targets = [f"{module_path}::{name}" for name in test_names]
+    else:
+        targets = [module_path if not test_name else f"{module_path}::{test_name}"]
+    collector, capture = ReportCollector(), HttpCapture()
+    exitcode = pytest_main_isolated(targets, [collector, capture])
+    if exitcode not in (0, 1):
+        print(f"❌ pytest завершился с кодом {exitcode}")
+        for c in collector.collectors:
+            print(c["longrepr"])
+        return {}
+    report = collector.report(exitcode)
+    for t in report["tests"]:
+        t["http"] = capture.calls.get(t["nodeid"], [])
+    return report
+
+
+# Сквозные сценарии: выполняются целиком в одном воркере и планируются первыми
+SCENARIO_TEST_RE = re.compile(r'^test_(?:crud_\w+_flow|auth_and_access_flow)$')
+HTTP_CALL_ATTRS = {'get', 'post', 'put', 'delete', 'patch', 'head', 'options', 'request'}
+
+
+def isolation_groups(test_file: str) -> List[Tuple[List[str], int]]:
+    """
+    Делит тесты модуля на группы, которые нельзя разносить по разным воркерам:
+      - тесты, пишущие в одну и ту же глобальную переменную (global x);
+      - тесты, использующие одну фикстуру с scope module/package/session.
+    Классы Test* идут одной группой. Вес группы — число HTTP-вызовов в ней
+    (сквозные сценарии получают вес не меньше самой тяжёлой группы).
+    Возвращает [(имена в порядке файла, вес)].
+    """
+    tree = analyze_test_file(test_file).tree
+    if tree is None:
+        return []
+
+    shared_fixtures: Set[str] = set()
+    tests: List[ast.AST] = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if node.name.startswith("test_"):
+                tests.append(node)
+            for dec in node.decorator_list:
+                for kw in getattr(dec, "keywords", []):
+                    if (kw.arg == "scope" and isinstance(kw.value, ast.Constant)
+                            and kw.value.value in ("module", "package", "session")):
+                        shared_fixtures.add(node.name)
+        elif isinstance(node, ast.ClassDef) and node.name.startswith("Test"):
+            tests.append(node)
+
+    parent = {t.name: t.name for t in tests}
+
+    def find(name: str) -> str:
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    owners: Dict[str, str] = {}
+    weights: Dict[str, int] = {}
+    for t in tests:
+        shared = {f"global:{n}" for g in ast.walk(t) if isinstance(g, ast.Global) for n in g.names}
+        shared |= {f"fixture:{a.arg}" for a in getattr(t, "args", ast.arguments(args=[])).args
+                   if a.arg in shared_fixtures}
+        for key in shared:
+            if key in owners:
+                parent[find(t.name)] = find(owners[key])
+            else:
+                owners[key] = t.name
+        weights[t.name] = 1 + sum(
+            1 for c in ast.walk(t)
+            if isinstance(c, ast.Call) and (
+                (isinstance(c.func, ast.Attribute) and c.func.attr in HTTP_CALL_ATTRS)
+                or (isinstance(c.func, ast.Name) and c.func.id == "send_request")
+            )
+        )
+
+    groups: Dict[str, List[str]] = {}
+    for t in tests:
+        groups.setdefault(find(t.name), []).append(t.name)
+    heaviest = max(weights.values(), default=1)
+    result = []
+    for names in groups.values():
+        weight = sum(weights[n] for n in names)
+        if any(SCENARIO_TEST_RE.match(n) for n in names):
+            weight = max(weight, heaviest)
+        result.append((names, weight))
+    return result
+
+
+def collection_positions(test_file: str) -> Dict[str, int]:
+    """
+    Строка определения тестов и классов Test* по имени из nodeid (без пути и параметров):
+    'test_x', 'TestPet', 'TestPet::test_get'. pytest собирает их в порядке строк файла.
+    """
+    tree = analyze_test_file(test_file).tree
+    positions: Dict[str, int] = {}
+    for node in tree.body if tree else []:
+        if isinstance(node, ast.ClassDef) and node.name.startswith("Test"):
+            positions[node.name] = node.lineno
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)) and child.name.startswith("test"):
+                    positions[f"{node.name}::{child.name}"] = child.lineno
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+            positions[node.name] = node.lineno
+    return positions
+
+
+def collection_position(nodeid: str, positions: Dict[str, int]) -> float:
+    # Параметры одного теста идут в одном воркере, их порядок сохраняет устойчивая сортировка
+    name = nodeid.split("::", 1)[-1].split("[")[0]
+    return positions.get(name, positions.get(name.split("::")[0], float("inf")))
+
+
+def merge_reports(reports: List[dict], positions: Dict[str, int]) -> dict:
+    """Объединяет отчёты воркеров в один в порядке сбора тестов, как при последовательном прогоне."""
+    tests = [t for r in reports for t in r.get("tests", [])]
+    tests.sort(key=lambda t: collection_position(t["nodeid"], positions))
+    summary: Dict[str, int] = defaultdict(int)
+    for t in tests:
+        summary[t["outcome"]] += 1
+    summary["total"] = summary["collected"] = len(tests)
+    return {
+        "exitcode": max((r.get("exitcode", 0) for r in reports), default=0),
+        "summary": dict(summary),
+        "collectors": [c for r in reports for c in r.get("collectors", [])],
+        "tests": tests,
+    }
+
+
+def run_pytest_parallel(module_path: str = None, jobs: int = 4, test_names: List[str] = None) -> dict:
+    """
+    Основной прогон набора в jobs процессах.
+    Группы из isolation_groups раскладываются по воркерам жадно (самая тяжёлая —
+    в наименее загруженный), внутри воркера тесты идут в порядке файла.
+    test_names — прогнать только эти тесты (группы передаются целиком).
+    """
+    module_path = module_path or TEST_FILE
+    groups = isolation_groups(module_path)
+    if test_names is not None:
+        selected = set(test_names)
+        groups = [g for g in groups if selected & set(g[0])]
+        if not groups:
+            return {"exitcode": 0, "summary": {"total": 0, "collected": 0}, "collectors": [], "tests": []}
+    if jobs <= 1 or len(groups) <= 1:
+        names = None if test_names is None else [n for g in groups for n in g[0]]
+        return run_pytest_inprocess(module_path=module_path, test_names=names)
+
+    positions = collection_positions(module_path)
+    bins: List[List[str]] = [[] for _ in range(min(jobs, len(groups)))]
+    loads = [0] * len(bins)
+    for names, weight in sorted(groups, key=lambda g: -g[1]):
+        i = loads.index(min(loads))
+        bins[i].extend(names)
+        loads[i] += weight
+
+    with process_pool(len(bins)) as pool:
+        futures = [
+            pool.submit(run_pytest_inprocess, None, module_path,
+                        sorted(names, key=lambda n: collection_position(n, positions)))
+            for names in bins
+        ]
+        reports = [future.result() for future in futures]
+    if not all(reports):
+        return {}
+    return merge_reports(reports, positions)
+
+
+def dump_json_atomic(path: str, data, **kwargs) -> None:
+    # Временный файл в том же каталоге и os.replace: прерванная запись
+    # не оставляет обрезанный файл, параллельные процессы не мешают друг другу
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, **kwargs)
+    os.replace(tmp, path)
+
+
+def report_state_path(test_file: str) -> str:
+    return os.path.join(REPORT_STATE_DIR, re.sub(r'[^\w.-]', '_', os.path.normpath(test_file)) + ".json")
+
+
+def save_report_state(test_file: str, report: dict) -> None:
+    """Сохраняет отчёт и AST-хэши тестов файла для инкрементальной переоценки следующей версии."""
+    if not report:
+        return
+    state = {"fingerprints": test_fingerprints(test_file), "tests": report.get("tests", [])}
+    path = report_state_path(test_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    dump_json_atomic(path, state)
+
+
+def load_report_state(test_file: str) -> dict:
+    try:
+        with open(report_state_path(test_file), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def previous_version(test_file: str) -> str | None:
+    # Qwen/v8_main.py -> Qwen/v7_main.py
+    m = re.search(r'v(\d+)_main\.py$', test_file)
+    if not m or int(m.group(1)) <= 1:
+        return None
+    return test_file[:m.start()] + f"v{int(m.group(1)) - 1}_main.py"
+
+
+def run_pytest_incremental(module_path: str = None, base_path: str = None, jobs: int = 1) -> dict:
+    """
+    Прогон только новых и изменённых тестов относительно ранее оценённой версии base_path.
+    Тест считается неизменным, если совпадает его AST-хэш вместе с зависимостями
+    (test_fingerprints; классы Test* — целиком). Если изменён хоть один тест
+    изоляционной группы, группа прогоняется целиком; группы без хэша прогоняются всегда.
+    Результаты неизменных тестов переносятся из отчёта base_path.
+    """
+    module_path = module_path or TEST_FILE
+    state = load_report_state(base_path) if base_path else {}
+    if not state:
+        return run_pytest_parallel(module_path, jobs)
+
+    fingerprints = test_fingerprints(module_path)
+    old_fingerprints = state.get("fingerprints", {})
+    unchanged = {name for name, fp in fingerprints.items() if old_fingerprints.get(name) == fp}
+    groups = isolation_groups(module_path)
+    for names, _ in groups:
+        if not unchanged.issuperset(names):
+            unchanged -= set(names)
+    to_run = [name for names, _ in groups for name in names if name not in unchanged]
+
+    carried = []
+    for t in state.get("tests", []):
+        suffix = t["nodeid"].split("::", 1)[-1]
+        # test_x[param] или TestX::test_m
+        if suffix.split("::")[0].split("[")[0] in unchanged:
+            carried.append({**t, "nodeid": f"{module_path}::{suffix}"})
+
+    report = run_pytest_parallel(module_path, jobs, test_names=to_run)
+    if not report:
+        return {}
+    print(f"♻️ Перенесено из {base_path}: {len(carried)} тестов, перезапущено: {len(to_run)}")
+    return merge_reports([report, {"tests": carried}], collection_positions(module_path))
+
+
+def preloaded(module_name: str) -> bool:
+    # В форке форк-сервера предзагруженный модуль уже в sys.modules и импортирован не в этом процессе
+    module = sys.modules.get(module_name)
+    return module is not None and getattr(module, "LOADED_PID", os.getpid()) != os.getpid()
+
+
+def warm_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Пул на прогретом форк-сервере, один на процесс для каждого max_workers:
+    создаётся при первом вызове и переиспользуется, каждая задача — свежий форк.
+    """
+    if max_workers in _WARM_POOLS:
+        return _WARM_POOLS[max_workers]
+    ctx = multiprocessing.get_context("forkserver")
+    # Предзагрузка '__main__' в форк-сервере не срабатывает (Python 3.11),
+    # поэтому грузим сам metrics по имени модуля: тогда повторный запуск
+    # главного скрипта в дочернем процессе берёт все импорты из кэша.
+    # Форк-сервер запускается через python -c и не получает sys.path родителя:
+    # каталог metrics передаём через PYTHONPATH
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    python_path = os.environ.get("PYTHONPATH", "").split(os.pathsep)
+    if script_dir not in python_path:
+        os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [script_dir, *python_path]))
+    module_name = os.path.splitext(os.path.basename(__file__))[0]
+    ctx.set_forkserver_preload([module_name, *WARM_PRELOAD])
+    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx, max_tasks_per_child=1)
+    # Форк-сервер молча пропускает модули, которые не смог импортировать
+    if not pool.submit(preloaded, module_name).result():
+        print(f"⚠️ Форк-сервер не смог импортировать {module_name}: "
+              f"каждый прогон заново импортирует {', '.join(WARM_PRELOAD)}")
+    _WARM_POOLS[max_workers] = pool
+    return pool
+
+
+def process_pool(max_workers: int) -> AbstractContextManager:
+    """
+    Пул процессов для прогонов pytest (использовать в with).
+    При USE_WARM_POOL — общий пул warm_pool: воркеры форкаются от прогретого
+    форк-сервера, по одному свежему процессу на задачу; with его не закрывает.
+    """
+    if not USE_WARM_POOL:
+        return ProcessPoolExecutor(max_workers=max_workers)
+    return nullcontext(warm_pool(max_workers))
+
+
+def run_pytest_warm(test_name: str = None, module_path: str = None) -> dict:
+    """
+    Изолированный прогон, как run_pytest_json, но в процессе-форке
+    прогретого форк-сервера вместо нового интерпретатора.
+    """
+    return warm_pool(1).submit(run_pytest_inprocess, test_name, module_path or TEST_FILE).result()
+
+
 def extract_longrepr_text(lr) -> str:
     if isinstance(lr, str):
         return html.unescape(lr)
@@ -66,54 +584,145 @@ def extract_longrepr_text(lr) -> str:
         return str(lr)
     
 
-def get_pass_fail_rate_firs(report: dict) -> Tuple[int, int]:
+# Одно регулярное выражение на все виды assert-ов, которые различает классификатор:
+#   adjusted — assert 200 == CODE, CODE из ACCEPTABLE_CODES;
+#   codes    — assert 200 in [C1, C2, ...] / (C1, C2);
+#   suspicious — assert 4xx == 200 или assert 5xx == 200
+STATUS_ASSERT_RE = re.compile(
+    r"assert\s+(?:"
+    r"200\s+(?:==\s+(?P<adjusted>" + "|".join(map(str, ACCEPTABLE_CODES)) + r")"
+    r"|in\s+[\[\(](?P<codes>[^\]\)]+)[\]\)])"
+    r"|(?P<suspicious>[45])\d\d\s+==\s+200)"
+)
+
+
+@dataclass
+class PassFailResult:
+    """Категории тестов отчёта: passed / adjusted / suspicious / failed."""
+    total: int = 0
+    passed: int = 0
+    adjusted: List[str] = field(default_factory=list)
+    # assert 4xx == 200 — учитывается в сводных метриках
+    suspicious: List[str] = field(default_factory=list)
+    # assert 4xx/5xx == 200 — для списка подозрительных в print_pass_fail_details
+    suspicious_details: List[str] = field(default_factory=list)
+    categories: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def failed(self) -> int:
+        return self.total - self.passed
+
+
+# Последний классифицированный отчёт: (report, результат)
+_PASS_FAIL_CACHE: List[Tuple[dict, PassFailResult]] = []
+
+
+def classify_status_assert(text: str) -> Tuple[bool, bool, bool]:
     """
-    Выводит сводные метрики по тестам:
-     - total, corrected_cnt/%, suspicious_cnt/% 
-     - Adjusted Pass Rate
-    Возвращает (passed, failed).
+    Один проход STATUS_ASSERT_RE по тексту падения.
+    Возвращает (adjusted, suspicious 4xx, suspicious 5xx).
     """
-    tests = report.get("tests", [])
-    total = len(tests)
+    adjusted = False
+    codes_seen = False
+    suspicious_4xx = suspicious_5xx = False
+    for m in STATUS_ASSERT_RE.finditer(text):
+        if m.group("adjusted"):
+            adjusted = True
+        elif m.group("codes") is not None:
+            # Как и раньше, учитывается только первое assert 200 in [...]
+            if codes_seen:
+                continue
+            codes_seen = True
+            try:
+                codes = [int(c.strip()) for c in m.group("codes").split(",")]
+            except ValueError:
+                continue
+            if any(c in ACCEPTABLE_CODES for c in codes):
+                adjusted = True
+        elif m.group("suspicious") == "4":
+            suspicious_4xx = True
+        else:
+            suspicious_5xx = True
+    return adjusted, suspicious_4xx, suspicious_5xx
+
+
+# Структурный assert (левый, оператор, правый) -> категория без разбора текста
+STATUS_ASSERT_CATEGORIES: Dict[Tuple[int, str, int], str] = {
+    **{(200, "==", code): "adjusted" for code in ACCEPTABLE_CODES},
+    **{(code, "==", 200): "suspicious_4xx" for code in range(400, 500)},
+    **{(code, "==", 200): "suspicious_5xx" for code in range(500, 600)},
+}
 
-    adjusted = []
-    suspicious = []
 
+def classify_status_asserts(asserts: List[list]) -> Tuple[bool, bool, bool]:
+    """
+    То же, что classify_status_assert, но по записанным ReportCollector операндам.
+    Правый операнд in / not in — кортеж или список (после JSON); assert ... not in [...]
+    ни к одной категории не относится, как и в текстовом классификаторе.
+    """
+    found = set()
+    for left, op, right in asserts:
+        if op == "in":
+            if left == 200 and any(c in ACCEPTABLE_CODES for c in right):
+                found.add("adjusted")
+        elif op in ("==", "!="):
+            found.add(STATUS_ASSERT_CATEGORIES.get((left, op, right)))
+    return "adjusted" in found, "suspicious_4xx" in found, "suspicious_5xx" in found
+
+
+def classify_report(report: dict) -> PassFailResult:
+    """
+    Разбирает каждый тест отчёта ровно один раз: по структурным status_asserts,
+    если они есть, иначе по тексту падения (декодируется один раз на тест). Результат запоминается для последнего отчёта, так что
+    все функции вывода pass rate используют одну классификацию.
+    """
+    if _PASS_FAIL_CACHE and _PASS_FAIL_CACHE[0][0] is report:
+        return _PASS_FAIL_CACHE[0][1]
+
+    tests = report.get("tests", [])
+    result = PassFailResult(total=len(tests))
     for t in tests:
-        if t.get("outcome") != "passed":
+        nid = t["nodeid"]
+        if t.get("outcome") == "passed":
+            result.passed += 1
+            result.categories[nid] = "passed"
+            continue
+        if "status_asserts" in t:
+            adjusted, suspicious_4xx, suspicious_5xx = classify_status_asserts(t["status_asserts"])
+        else:
+            # Отчёт pytest-json-report или падение не на статус-коде
             text = extract_longrepr_text(t["call"].get("longrepr", ""))
-            nid = t["nodeid"]
+            adjusted, suspicious_4xx, suspicious_5xx = classify_status_assert(text)
+        if adjusted:
+            result.passed += 1
+            result.adjusted.append(nid)
+            result.categories[nid] = "adjusted"
+            continue
+        if suspicious_4xx:
+            result.suspicious.append(nid)
+            result.suspicious_details.append(nid)
+        if suspicious_5xx:
+            result.suspicious_details.append(nid)
+        result.categories[nid] = "suspicious" if suspicious_4xx or suspicious_5xx else "failed"
 
-            # 1) assert 200 == CODE
-            if any(re.search(rf"assert\s+200\s+==\s+{c}", text) for c in ACCEPTABLE_CODES):
-                adjusted.append(nid)
-                continue
+    _PASS_FAIL_CACHE[:] = [(report, result)]
+    return result
 
-            # 2) assert 200 in [C1, C2, ...]
-            m = re.search(r"assert\s+200\s+in\s+[\[\(]([^\]\)]+)[\]\)]", text)
-            if m:
-                try:
-                    codes = [int(c.strip()) for c in m.group(1).split(",")]
-                    if any(c in ACCEPTABLE_CODES for c in codes):
-                        adjusted.append(nid)
-                        continue
-                except ValueError:
-                    pass
-
-            # 3) assert 4xx == 200
-            if re.search(r"assert\s+4\d\d\s+==\s+200", text):
-                suspicious.append(nid)
-
-    corrected_cnt   = len(adjusted)
-    suspicious_cnt  = len(suspicious)
-    passed          = sum(1 for t in tests if t.get("outcome") == "passed" or t["nodeid"] in adjusted)
-    failed          = total - passed
-    total_nonzero   = total or 1
+
+def get_pass_fail_rate_firs(report: dict) -> Tuple[int, int]:
+    """
+    Выводит сводные метрики по тестам:
+     - total, corrected_cnt/%, suspicious_cnt/% 
+     - Adjusted Pass Rate
+    Возвращает (passed, failed).
+    """
+    result = classify_report(report)
+    total_nonzero = result.total or 1
 
     print("\n📊 Результаты get_pass_fail_rate:")
-    print(f"🎯 Pass Rate: {passed}/{total} ({passed/total_nonzero:.1%})")
+    print(f"🎯 Pass Rate: {result.passed}/{result.total} ({result.passed/total_nonzero:.1%})")
 
-    return passed, failed
+    return result.passed, result.failed
 
 def get_pass_fail_rate_sec(report: dict) -> Tuple[int, int]:
     """
@@ -122,47 +731,15 @@ def get_pass_fail_rate_sec(report: dict) -> Tuple[int, int]:
      - Adjusted Pass Rate
     Возвращает (passed, failed).
     """
-    tests = report.get("tests", [])
-    total = len(tests)
-
-    adjusted = []
-    suspicious = []
-
-    for t in tests:
-        if t.get("outcome") != "passed":
-            text = extract_longrepr_text(t["call"].get("longrepr", ""))
-            nid = t["nodeid"]
-
-            # 1) assert 200 == CODE
-            if any(re.search(rf"assert\s+200\s+==\s+{c}", text) for c in ACCEPTABLE_CODES):
-                adjusted.append(nid)
-                continue
-
-            # 2) assert 200 in [C1, C2, ...]
-            m = re.search(r"assert\s+200\s+in\s+[\[\(]([^\]\)]+)[\]\)]", text)
-            if m:
-                try:
-                    codes = [int(c.strip()) for c in m.group(1).split(",")]
-                    if any(c in ACCEPTABLE_CODES for c in codes):
-                        adjusted.append(nid)
-                        continue
-                except ValueError:
-                    pass
-
-            # 3) assert 4xx == 200
-            if re.search(r"assert\s+4\d\d\s+==\s+200", text):
-                suspicious.append(nid)
-
-    corrected_cnt   = len(adjusted)
-    suspicious_cnt  = len(suspicious)
-    passed          = sum(1 for t in tests if t.get("outcome") == "passed" or t["nodeid"] in adjusted)
-    failed          = total - passed
-    total_nonzero   = total or 1
+    result = classify_report(report)
+    corrected_cnt   = len(result.adjusted)
+    suspicious_cnt  = len(result.suspicious)
+    total_nonzero   = result.total or 1
 
     print(f"✔️ Скорректировано (200==4xx / in [...]): {corrected_cnt} ({corrected_cnt/total_nonzero*100:.1f}%)")
     print(f"🟡 Подозрительных (4xx==200): {suspicious_cnt} ({suspicious_cnt/total_nonzero*100:.1f}%)")
 
-    return passed, failed
+    return result.passed, result.failed
 
 
 def print_pass_fail_details(report: dict) -> None:
@@ -171,117 +748,734 @@ def print_pass_fail_details(report: dict) -> None:
      - скорректированные тесты (assert 200==4xx и in [...])
      - подозрительные тесты (assert 4xx(500)==200)
     """
-    tests = report.get("tests", [])
-    adjusted = []
-    suspicious = []
-
-    for t in tests:
-        if t.get("outcome") != "passed":
-            text = extract_longrepr_text(t["call"].get("longrepr", ""))
-            nid = t["nodeid"]
+    result = classify_report(report)
 
-            if any(re.search(rf"assert\s+200\s+==\s+{c}", text) for c in ACCEPTABLE_CODES):
-                adjusted.append(nid)
-                continue
-            m = re.search(r"assert\s+200\s+in\s+[\[\(]([^\]\)]+)[\]\)]", text)
-            if m:
-                try:
-                    codes = [int(c.strip()) for c in m.group(1).split(",")]
-                    if any(c in ACCEPTABLE_CODES for c in codes):
-                        adjusted.append(nid)
-                        continue
-                except ValueError:
-                    pass
-            if re.search(r"assert\s+4\d\d\s+==\s+200", text):
-                suspicious.append(nid)
-            if re.search(r"assert\s+5\d\d\s+==\s+200", text):
-                suspicious.append(nid)
-
-    if adjusted:
+    if result.adjusted:
         print("\n✔️ Список скорректированных тестов:")
-        for nid in adjusted:
+        for nid in result.adjusted:
             print(f"   - {nid}")
-    if suspicious:
+    if result.suspicious_details:
         print("\n🟡 Список подозрительных тестов:")
-        for nid in suspicious:
+        for nid in result.suspicious_details:
             print(f"   - {nid}")
 
 
-def extract_used_endpoints(test_file: str) -> Set[Tuple[str, str]]:
-    text = open(test_file, encoding='utf-8').read()
+@dataclass
+class CallSite:
+    """HTTP-вызов в файле тестов."""
+    function: str            # функция, в которой сделан вызов ('' — уровень модуля)
+    lineno: int
+    method: str              # GET, POST, ...
+    raw_path: str            # путь без BASE_URL и query, подстановки f-строк — '{}'
+    var: str | None = None   # переменная, в которую записан ответ
+    status_codes: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class ResponseLinks:
+    """
+    Ответы, переданные между функциями модуля: что функция возвращает
+    (CallSite или имя вызванного helper-а) и assert-ы над x = helper().
+    """
+    returns: Dict[str, List[CallSite | str]] = field(default_factory=lambda: defaultdict(list))
+    asserts: List[Tuple[str, Set[str]]] = field(default_factory=list)
+
+
+@dataclass
+class TestFileAnalysis:
+    """Результат одного AST-прохода по файлу тестов."""
+    tree: ast.Module | None
+    test_names: List[str]
+    call_sites: List[CallSite]
+    # Функция -> все (METHOD, путь), до которых она доходит сама и через вызываемые
+    # функции модуля и фикстуры; '' — код уровня модуля
+    summaries: Dict[str, Set[Tuple[str, str]]] = field(default_factory=dict)
+    # Функции, достижимые из тестов, фикстур и уровня модуля
+    reachable: Set[str] = field(default_factory=set)
+    # (qualname, строка def) -> сложность, длина и число HTTP-запросов (с учётом helper-ов);
+    # переопределённые функции и одноимённые методы классов не перекрывают друг друга
+    metrics: Dict[Tuple[str, int], 'FunctionMetrics'] = field(default_factory=dict)
+
+
+@dataclass
+class FunctionMetrics:
+    complexity: int   # цикломатическая сложность, как у radon ComplexityVisitor
+    length: int       # строк от def до конца тела
+    requests: int     # HTTP-вызовов в самой функции и в вызываемых ею функциях модуля
+
+
+HTTP_VERBS = {'get', 'post', 'put', 'delete', 'patch'}
+URL_PLACEHOLDER = '{}'
+
+# (путь, mtime, размер) -> результат анализа
+_ANALYSIS_CACHE: Dict[Tuple[str, int, int], TestFileAnalysis] = {}
+
+
+def scope_nodes(scope: ast.AST):
+    """Узлы одной области видимости, без тел вложенных функций и классов."""
+    stack = list(ast.iter_child_nodes(scope))
+    while stack:
+        node = stack.pop()
+        yield node
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            stack.extend(ast.iter_child_nodes(node))
+
+
+def url_text(node: ast.AST, names: Dict[str, ast.AST], seen: Set[str] = frozenset()) -> str | None:
+    """
+    Восстанавливает текст URL из выражения: строка, f-строка, BASE_URL + "...",
+    переменная с URL. Неизвестные подстановки заменяются на '{}'.
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(str(value.value))
+            else:
+                parts.append(url_part(value.value, names, seen))
+        return ''.join(parts)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        if url_text(node.left, names, seen) is None and url_text(node.right, names, seen) is None:
+            return None
+        return url_part(node.left, names, seen) + url_part(node.right, names, seen)
+    if isinstance(node, ast.Name) and node.id in names and node.id not in seen:
+        return url_text(names[node.id], names, seen | {node.id})
+    return None
+
 
-    # 1) Collect URL variable definitions
-    url_var_pattern = re.compile(
-        r'(\w+)\s*=\s*'
-        r'(?:f?["\'](?:\{?BASE_URL\}?/)?([^"\'\?]+)(?:\?[^"\']*)?["\']'
-        r'|BASE_URL\s*\+\s*["\']([^"\\?]+)["\'])',
-        re.IGNORECASE
+def url_part(node: ast.AST, names: Dict[str, ast.AST], seen: Set[str]) -> str:
+    """
+    Часть составного URL. Переменная подставляется, только если сама похожа на URL
+    (BASE_URL, PET_URL = f"{BASE_URL}/pet", "/pet"), иначе это параметр пути -> '{}'.
+    """
+    text = url_text(node, names, seen)
+    if text is None or (isinstance(node, ast.Name) and '://' not in text and not text.startswith('/')):
+        return URL_PLACEHOLDER
+    return text
+
+
+def url_path(text: str, base_path: str) -> str | None:
+    # https://host/v2/pet/{}?status=x -> /pet/{}
+    text = text.split('?')[0]
+    if '://' in text:
+        text = urlsplit(text).path
+    if base_path and (text == base_path or text.startswith(base_path + '/')):
+        text = text[len(base_path):]
+    path = '/' + text.strip('/')
+    if not any(seg and seg != URL_PLACEHOLDER for seg in path.split('/')):
+        return None
+    return path
+
+
+def http_call(call: ast.Call, sessions: Set[str]) -> Tuple[str, ast.AST] | None:
+    """
+    Распознаёт HTTP-вызов и возвращает (METHOD, выражение URL):
+      requests.get(url), session.post(url=...), requests.request("GET", url),
+      send_request("GET", url).
+    """
+    func = call.func
+    args = list(call.args)
+    kwargs = {kw.arg: kw.value for kw in call.keywords if kw.arg}
+    if isinstance(func, ast.Attribute):
+        receiver = func.value
+        recv_name = receiver.id if isinstance(receiver, ast.Name) else (
+            receiver.attr if isinstance(receiver, ast.Attribute) else '')
+        if recv_name != 'requests' and 'session' not in recv_name.lower() and recv_name not in sessions:
+            return None
+        if func.attr in HTTP_VERBS:
+            url = args[0] if args else kwargs.get('url')
+            return (func.attr.upper(), url) if url is not None else None
+        if func.attr != 'request':
+            return None
+    elif not (isinstance(func, ast.Name) and func.id == 'send_request'):
+        return None
+    method = args[0] if args else kwargs.get('method')
+    url = args[1] if len(args) > 1 else kwargs.get('url')
+    if (isinstance(method, ast.Constant) and isinstance(method.value, str)
+            and method.value.lower() in HTTP_VERBS and url is not None):
+        return method.value.upper(), url
+    return None
+
+
+def asserted_status_codes(test: ast.AST) -> Tuple[str, Set[str]] | None:
+    """
+    Из assert var.status_code == 200 / in [200, 404] / 200 == var.status_code
+    достаёт (var, {коды}).
+    """
+    if not isinstance(test, ast.Compare) or len(test.ops) != 1:
+        return None
+    left, op, right = test.left, test.ops[0], test.comparators[0]
+    if isinstance(op, ast.Eq) and isinstance(left, ast.Constant):
+        left, right = right, left
+    if not (isinstance(left, ast.Attribute) and left.attr == 'status_code' and isinstance(left.value, ast.Name)):
+        return None
+    if isinstance(op, ast.Eq) and isinstance(right, ast.Constant) and isinstance(right.value, int):
+        return left.value.id, {str(right.value)}
+    if isinstance(op, ast.In) and isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+        codes = {str(e.value) for e in right.elts if isinstance(e, ast.Constant) and isinstance(e.value, int)}
+        return (left.value.id, codes) if codes else None
+    return None
+
+
+def helper_call(node: ast.AST, helpers: Set[str]) -> str | None:
+    # helper(...) или self.helper(...) для функции модуля
+    if not isinstance(node, ast.Call):
+        return None
+    func = node.func
+    if isinstance(func, ast.Name) and func.id in helpers:
+        return func.id
+    if (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name)
+            and func.value.id in ('self', 'cls') and func.attr in helpers):
+        return func.attr
+    return None
+
+
+def analyze_scope(scope: ast.AST, name: str, module_names: Dict[str, ast.AST],
+                  sessions: Set[str], base_path: str,
+                  helpers: Set[str] = frozenset(), links: ResponseLinks = None) -> List[CallSite]:
+    """
+    HTTP-вызовы одной функции (или уровня модуля) с привязанными к ним assert-ами.
+    Если передан links, в него записываются возвращаемые ответы и assert-ы
+    над ответами helper-ов (x = helper(); assert x.status_code == ...).
+    """
+    nodes = sorted(
+        (n for n in scope_nodes(scope) if hasattr(n, 'lineno')),
+        key=lambda n: (n.lineno, n.col_offset)
     )
-    url_vars: Dict[str, str] = {}
-    for m in url_var_pattern.finditer(text):
-        var = m.group(1)
-        raw = m.group(2) or m.group(3)
-        url_vars[var] = raw.strip('/')
-        # print(f"Found URL var: {var} = {raw}")  # Debug
-
-    # 2) Patterns for direct HTTP calls
-    direct_patterns = [
-        # Match session/requests.get|post|put|delete(f"...")
-        re.compile(
-            r'(?:requests|session)\.(get|post|put|delete)\s*\(\s*f?["\']'
-            r'(?:\{?BASE_URL\}?/)?([^"\'\?]+?)(?:\?[^"\']*)?["\']\s*(?:,.*)?\)',
-            re.IGNORECASE
-        ),
-        # Match send_request("METHOD", f"...")
-        re.compile(
-            r'send_request\(\s*["\'](GET|POST|PUT|DELETE)["\']\s*,\s*f?["\']'
-            r'(?:\{?BASE_URL\}?/)?([^"\'\?]+)(?:\?[^"\']*)?["\']',
-            re.IGNORECASE
-        ),
-        # Match send_request("METHOD", BASE_URL + "...")
-        re.compile(
-            r'send_request\(\s*["\'](GET|POST|PUT|DELETE)["\']\s*,\s*'
-            r'BASE_URL\s*\+\s*["\']([^"\\?]+)["\']',
-            re.IGNORECASE
-        ),
-    ]
+    names = dict(module_names)
+    local_sessions = set(sessions)
+    for node in nodes:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            target = node.targets[0].id
+            if isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Attribute) \
+                    and node.value.func.attr == 'Session':
+                local_sessions.add(target)
+            elif scope is not None and not isinstance(node.value, ast.Call):
+                names[target] = node.value
+
+    sites: List[CallSite] = []
+    by_call: Dict[int, CallSite] = {}
+    for node in nodes:
+        if isinstance(node, ast.Call):
+            found = http_call(node, local_sessions)
+            if found:
+                text = url_text(found[1], names)
+                path = url_path(text, base_path) if text is not None else None
+                if path:
+                    site = CallSite(name, node.lineno, found[0], path)
+                    sites.append(site)
+                    by_call[id(node)] = site
+
+    def responses(value: ast.AST | None) -> List[CallSite | str]:
+        # Ответ, который даёт выражение: HTTP-вызов, helper() или переменная с ответом
+        if value is None:
+            return []
+        if id(value) in by_call:
+            return [by_call[id(value)]]
+        helper = helper_call(value, helpers)
+        if helper:
+            return [helper]
+        if isinstance(value, ast.Name):
+            return bound.get(value.id, [])
+        return []
+
+    # Присваивание ответа, assert-ы и return обходим по порядку строк
+    bound: Dict[str, List[CallSite | str]] = {}
+    for node in nodes:
+        if isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            value = responses(node.value)
+            for target in targets:
+                if isinstance(target, ast.Name):
+                    site = by_call.get(id(node.value))
+                    if site:
+                        site.var = target.id
+                    if value:
+                        bound[target.id] = value
+                    else:
+                        bound.pop(target.id, None)
+        elif isinstance(node, ast.Assert):
+            found = asserted_status_codes(node.test)
+            for target in bound.get(found[0], []) if found else []:
+                if isinstance(target, CallSite):
+                    target.status_codes |= found[1]
+                elif links is not None:
+                    links.asserts.append((target, found[1]))
+        elif isinstance(node, ast.Return) and links is not None:
+            links.returns[name].extend(responses(node.value))
+    return sites
+
+
+def link_helper_responses(links: ResponseLinks) -> None:
+    """
+    Assert-ы над x = helper() относятся к HTTP-вызовам, ответ которых helper
+    возвращает (в том числе через цепочку helper-ов).
+    """
+    resolved: Dict[str, List[CallSite]] = {}
+
+    def returned_sites(name: str) -> List[CallSite]:
+        if name not in resolved:
+            resolved[name] = []  # рекурсия: повторный заход даёт пустой список
+            sites: List[CallSite] = []
+            for target in links.returns.get(name, ()):
+                sites.extend([target] if isinstance(target, CallSite) else returned_sites(target))
+            resolved[name] = sites
+        return resolved[name]
+
+    for helper, codes in links.asserts:
+        for site in returned_sites(helper):
+            site.status_codes |= codes
+
+
+def is_fixture(func: ast.AST) -> bool:
+    # @pytest.fixture, @pytest.fixture(...), @fixture
+    for dec in func.decorator_list:
+        target = dec.func if isinstance(dec, ast.Call) else dec
+        name = target.attr if isinstance(target, ast.Attribute) else getattr(target, 'id', '')
+        if name == 'fixture':
+            return True
+    return False
+
+
+def call_graph(functions: List[ast.AST]) -> Dict[str, Set[str]]:
+    """
+    Рёбра функция -> функции модуля, которые она вызывает: helper(), self.helper(),
+    а также фикстуры, запрошенные через аргументы.
+    """
+    known = {f.name for f in functions}
+    fixtures = {f.name for f in functions if is_fixture(f)}
+    graph: Dict[str, Set[str]] = {}
+    for func in functions:
+        callees = graph.setdefault(func.name, set())
+        callees.update(a.arg for a in func.args.args if a.arg in fixtures)
+        for node in scope_nodes(func):
+            if not isinstance(node, ast.Call):
+                continue
+            target = node.func
+            if isinstance(target, ast.Name) and target.id in known:
+                callees.add(target.id)
+            elif (isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name)
+                    and target.value.id in ('self', 'cls') and target.attr in known):
+                callees.add(target.attr)
+        callees.discard(func.name)
+    return graph
+
+
+def endpoint_summaries(graph: Dict[str, Set[str]],
+                       call_sites: List[CallSite]) -> Dict[str, Set[Tuple[str, str]]]:
+    """
+    Сводка для каждой функции: собственные HTTP-вызовы плюс сводки вызываемых.
+    Каждая функция обходится один раз (мемоизация), так что проход линеен
+    по размеру графа. Во взаимной рекурсии функции получают сводку, собранную
+    до момента повторного захода.
+    """
+    own: Dict[str, Set[Tuple[str, str]]] = defaultdict(set)
+    for site in call_sites:
+        own[site.function].add((site.method, site.raw_path))
+
+    summaries: Dict[str, Set[Tuple[str, str]]] = {}
+
+    def visit(name: str) -> Set[Tuple[str, str]]:
+        if name in summaries:
+            return summaries[name]
+        summary = summaries[name] = set(own.get(name, ()))
+        for callee in graph.get(name, ()):
+            summary |= visit(callee)
+        return summary
+
+    for name in graph:
+        visit(name)
+    summaries[''] = set(own.get('', ()))
+    return summaries
+
+
+def cyclomatic_complexity(func: ast.AST) -> int:
+    # Те же правила, что у radon: ветвления, циклы, except, assert, булевы операторы.
+    # Как и radon, внутрь выражения assert не заходим (assert a or b — это +1)
+    complexity = 1
+    stack = list(ast.iter_child_nodes(func))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Assert):
+            complexity += 1
+            continue
+        if isinstance(node, ast.Try):
+            complexity += len(node.handlers) + bool(node.orelse)
+        elif isinstance(node, ast.BoolOp):
+            complexity += len(node.values) - 1
+        elif isinstance(node, (ast.If, ast.IfExp)):
+            complexity += 1
+        elif isinstance(node, ast.Match):
+            # case _: не считается
+            wildcard = any(isinstance(c.pattern, ast.MatchAs) and c.pattern.pattern is None for c in node.cases)
+            complexity += max(0, len(node.cases) - wildcard)
+        elif isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+            complexity += bool(node.orelse) + 1
+        elif isinstance(node, ast.comprehension):
+            complexity += len(node.ifs) + 1
+        stack.extend(ast.iter_child_nodes(node))
+    return complexity
+
+
+def request_counts(graph: Dict[str, Set[str]], call_sites: List[CallSite]) -> Dict[str, int]:
+    """Число HTTP-вызовов функции вместе с вызываемыми ею функциями (мемоизация, как endpoint_summaries)."""
+    own: Dict[str, int] = defaultdict(int)
+    for site in call_sites:
+        own[site.function] += 1
+    counts: Dict[str, int] = {}
+
+    def visit(name: str) -> int:
+        if name not in counts:
+            counts[name] = own.get(name, 0)
+            counts[name] += sum(visit(callee) for callee in graph.get(name, ()))
+        return counts[name]
+
+    for name in graph:
+        visit(name)
+    return counts
+
+
+def qualified_names(tree: ast.Module) -> Dict[int, str]:
+    """id(узла функции) -> qualname: TestPet.test_get, outer.<locals>.inner."""
+    names: Dict[int, str] = {}
+    stack = [(node, '') for node in tree.body]
+    while stack:
+        node, prefix = stack.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            names[id(node)] = prefix + node.name
+            stack.extend((child, f"{prefix}{node.name}.<locals>.") for child in node.body)
+        elif isinstance(node, ast.ClassDef):
+            stack.extend((child, f"{prefix}{node.name}.") for child in node.body)
+        else:
+            stack.extend((child, prefix) for child in ast.iter_child_nodes(node))
+    return names
+
+
+def reachable_functions(graph: Dict[str, Set[str]], roots: Set[str]) -> Set[str]:
+    seen = set(roots)
+    stack = list(roots)
+    while stack:
+        for callee in graph.get(stack.pop(), ()):
+            if callee not in seen:
+                seen.add(callee)
+                stack.append(callee)
+    return seen
+
+
+def analyze_test_file(test_file: str) -> TestFileAnalysis:
+    """
+    Один AST-проход по файлу тестов: имена тестов, HTTP-вызовы (метод, путь)
+    и проверяемые у них статус-коды, сводки эндпоинтов по функциям с учётом
+    вспомогательных функций. Результат кэшируется по (путь, mtime, размер).
+    """
+    st = os.stat(test_file)
+    key = (os.path.abspath(test_file), st.st_mtime_ns, st.st_size)
+    if key in _ANALYSIS_CACHE:
+        return _ANALYSIS_CACHE[key]
+
+    with open(test_file, encoding='utf-8') as f:
+        source = f.read()
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        print(f"⚠️ Ошибка разбора файла тестов {test_file}: {e}")
+        result = TestFileAnalysis(None, [], [])
+        _ANALYSIS_CACHE[key] = result
+        return result
+
+    module_names: Dict[str, ast.AST] = {}
+    sessions: Set[str] = set()
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            if isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Attribute) \
+                    and node.value.func.attr == 'Session':
+                sessions.add(node.targets[0].id)
+            else:
+                module_names[node.targets[0].id] = node.value
+    base_text = url_text(module_names['BASE_URL'], module_names) if 'BASE_URL' in module_names else None
+    base_path = urlsplit(base_text or BASE_URL).path.rstrip('/')
+
+    functions = sorted(
+        (n for n in ast.walk(tree) if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))),
+        key=lambda n: n.lineno
+    )
+    helpers = {f.name for f in functions}
+    links = ResponseLinks()
+    call_sites = analyze_scope(tree, '', module_names, sessions, base_path, helpers, links)
+    for func in functions:
+        call_sites.extend(analyze_scope(func, func.name, module_names, sessions, base_path, helpers, links))
+    link_helper_responses(links)
+
+    # Вызовы функций модуля из кода верхнего уровня (например, setup при импорте)
+    graph = call_graph(functions)
+    graph[''] = {
+        n.func.id for n in scope_nodes(tree)
+        if isinstance(n, ast.Call) and isinstance(n.func, ast.Name) and n.func.id in graph
+    }
+    test_names = [f.name for f in functions if f.name.startswith('test_')]
+    roots = {''} | set(test_names) | {
+        f.name for f in functions
+        if is_fixture(f) or f.name.startswith(('setup', 'teardown'))
+    }
 
-    # 3) Pattern for variable-based calls
-    var_call_pattern = re.compile(
-        r'(?:(?:requests|session)\.(get|post|put|delete)|send_request)\s*\(\s*'
-        r'(?:["\'](GET|POST|PUT|DELETE)["\']\s*,\s*)?'
-        r'([^\s"\']+?)\s*(?:,|\))',
-        re.IGNORECASE
+    result = TestFileAnalysis(
+        tree=tree,
+        test_names=test_names,
+        call_sites=call_sites,
+        summaries=endpoint_summaries(graph, call_sites),
+        reachable=reachable_functions(graph, roots),
     )
+    requests_by_function = request_counts(graph, call_sites)
+    qualnames = qualified_names(tree)
+    for func in functions:
+        result.metrics[(qualnames.get(id(func), func.name), func.lineno)] = FunctionMetrics(
+            complexity=cyclomatic_complexity(func),
+            length=func.end_lineno - func.lineno + 1,
+            requests=requests_by_function.get(func.name, 0),
+        )
+    _ANALYSIS_CACHE[key] = result
+    return result
+
+
+PATH_PARAM_RE = re.compile(r'\{[^/{}]+\}')
+
 
-    fixed_segments = {
-        'pet', 'store', 'order', 'user',
-        'findByStatus', 'findByTags',
-        'inventory', 'login', 'logout'
+class PathTrie:
+    """
+    Дерево шаблонов путей спецификации по сегментам:
+    /pet/{petId}/uploadImage -> /pet/{param}/uploadImage.
+    Сопоставление конкретного пути — за длину пути: литеральный сегмент
+    проверяется раньше параметра, поэтому /user/login не станет /user/{param}.
+    """
+    __slots__ = ('children', 'param', 'template')
+
+    def __init__(self):
+        self.children: Dict[str, 'PathTrie'] = {}
+        self.param: 'PathTrie | None' = None
+        self.template: str | None = None
+
+    def insert(self, raw_path: str) -> None:
+        node = self
+        for seg in raw_path.strip('/').split('/'):
+            if PATH_PARAM_RE.fullmatch(seg):
+                node.param = node.param or PathTrie()
+                node = node.param
+            else:
+                node = node.children.setdefault(seg, PathTrie())
+        node.template = PATH_PARAM_RE.sub('{param}', raw_path)
+
+    def match(self, path: str) -> str | None:
+        segs = path.strip('/').split('/')
+        return self._match(segs, 0)
+
+    def _match(self, segs: List[str], i: int) -> str | None:
+        if i == len(segs):
+            return self.template
+        child = self.children.get(segs[i])
+        if child is not None:
+            found = child._match(segs, i + 1)
+            if found:
+                return found
+        return self.param._match(segs, i + 1) if self.param is not None else None
+
+    def literals(self) -> Set[str]:
+        """Все литеральные сегменты шаблонов — словарь для путей вне спецификации."""
+        result: Set[str] = set()
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            result.update(node.children)
+            stack.extend(node.children.values())
+            if node.param is not None:
+                stack.append(node.param)
+        return result
+
+
+# Сегменты Petstore на случай, если спецификация недоступна
+DEFAULT_FIXED_SEGMENTS = {
+    'pet', 'store', 'order', 'user', 'findByStatus', 'findByTags', 'uploadImage',
+    'inventory', 'login', 'logout', 'createWithArray', 'createWithList'
+}
+
+HTTP_METHODS = {'GET', 'POST', 'PUT', 'DELETE', 'PATCH'}
+# Ключи ответов OpenAPI: код, диапазон 2XX/4XX (OpenAPI 3) или default
+RESPONSE_KEY_RE = re.compile(r'^(?:[1-5]\d\d|[1-5]XX|default)$', re.IGNORECASE)
+
+
+def range_key(code: str) -> str:
+    # 404 -> 4XX
+    return f"{code[:1]}XX"
+
+
+class RefResolver:
+    """
+    Разрешение локальных $ref (#/definitions/..., #/components/responses/...)
+    для Swagger 2 и OpenAPI 3. Каждая ссылка разрешается один раз и запоминается,
+    цепочки $ref -> $ref проходятся до конца; циклы и внешние ссылки
+    (other.yaml#/...) возвращаются как есть.
+    """
+
+    def __init__(self, spec: dict):
+        self.spec = spec
+        self.cache: Dict[str, object] = {}
+
+    def resolve(self, node):
+        seen = set()
+        while isinstance(node, dict) and isinstance(node.get('$ref'), str):
+            ref = node['$ref']
+            if ref in self.cache:
+                return self.cache[ref]
+            if not ref.startswith('#/') or ref in seen:
+                return node
+            seen.add(ref)
+            target = self.pointer(ref)
+            if target is None:
+                return node
+            node = target
+        for ref in seen:
+            self.cache[ref] = node
+        return node
+
+    def pointer(self, ref: str):
+        # JSON Pointer: #/components/responses/Not~1Found -> ['components', 'responses', 'Not/Found']
+        node = self.spec
+        for part in ref[2:].split('/'):
+            part = part.replace('~1', '/').replace('~0', '~')
+            if isinstance(node, dict) and part in node:
+                node = node[part]
+            elif isinstance(node, list) and part.isdigit() and int(part) < len(node):
+                node = node[int(part)]
+            else:
+                return None
+        return node
+
+
+def merge_parameters(path_params: List[dict], op_params: List[dict], resolver: RefResolver) -> List[dict]:
+    # Параметры операции перекрывают параметры уровня пути с тем же (name, in)
+    merged: Dict[Tuple[str, str], dict] = {}
+    for param in list(path_params or []) + list(op_params or []):
+        param = resolver.resolve(param)
+        if isinstance(param, dict):
+            merged[(param.get('name'), param.get('in'))] = param
+    return list(merged.values())
+
+
+@dataclass
+class SpecIndex:
+    """
+    Спецификация, скомпилированная один раз для всех функций покрытия.
+    Ключи (METHOD, шаблон пути с {param}) интернированы и идут в порядке spec.
+    """
+    declared: Dict[Tuple[str, str], List[str]]   # все объявленные коды, включая default (отсортированы)
+    codes: Dict[Tuple[str, str], Set[str]]       # объявленные коды без default
+    numeric: Dict[Tuple[str, str], Set[str]]     # только числовые коды
+    sections: Dict[str, List[Tuple[str, str]]]   # раздел (/pet, /store, ...) -> ключи по (path, method)
+    trie: PathTrie
+    vocabulary: Set[str]                         # литеральные сегменты для путей вне spec
+    parameters: Dict[Tuple[str, str], List[dict]] = field(default_factory=dict)  # с учётом уровня пути
+
+    @classmethod
+    def from_spec(cls, openapi_spec: dict | None) -> 'SpecIndex':
+        """
+        Swagger 2 и OpenAPI 3: $ref у path item, операций, ответов и параметров
+        разрешаются через общий RefResolver, так что каждый компонент
+        просматривается один раз и сборка линейна по размеру spec.
+        """
+        spec = openapi_spec or {}
+        resolver = RefResolver(spec)
+        declared: Dict[Tuple[str, str], List[str]] = {}
+        codes: Dict[Tuple[str, str], Set[str]] = {}
+        numeric: Dict[Tuple[str, str], Set[str]] = {}
+        parameters: Dict[Tuple[str, str], List[dict]] = {}
+        trie = PathTrie()
+        for raw_path, path_item in (spec.get('paths', {}) or {}).items():
+            path_item = resolver.resolve(path_item)
+            if not isinstance(path_item, dict):
+                continue
+            trie.insert(raw_path)
+            norm = sys.intern(PATH_PARAM_RE.sub('{param}', raw_path))
+            for method, op in path_item.items():
+                m = sys.intern(method.upper())
+                if m not in HTTP_METHODS:
+                    continue
+                op = resolver.resolve(op) or {}
+                # Коды из YAML могут прийти числами: 200: {...}; неразрешённый $ref и
+                # расширения x-... кодами не считаются, диапазоны приводятся к 4XX
+                resolved = resolver.resolve(op.get('responses', {}))
+                if not isinstance(resolved, dict) or '$ref' in resolved:
+                    resolved = {}
+                responses = [
+                    str(code).upper() if str(code).lower() != 'default' else str(code)
+                    for code in resolved if RESPONSE_KEY_RE.match(str(code))
+                ]
+                key = (m, norm)
+                declared[key] = sorted(responses)
+                codes[key] = {code for code in responses if code.lower() != 'default'}
+                numeric[key] = {code for code in responses if code.isdigit()}
+                parameters[key] = merge_parameters(path_item.get('parameters'), op.get('parameters'), resolver)
+
+        sections: Dict[str, List[Tuple[str, str]]] = {}
+        for key in sorted(declared, key=lambda x: (x[1], x[0])):
+            path = key[1]
+            section = path.split('/')[1] if '/' in path else path
+            sections.setdefault(section, []).append(key)
+        return cls(declared, codes, numeric, sections, trie, trie.literals() | DEFAULT_FIXED_SEGMENTS, parameters)
+
+    def hits(self, key: Tuple[str, str], received) -> Set[str]:
+        """Объявленные коды эндпоинта, покрытые полученными: совпавшие коды и диапазоны 2XX/4XX."""
+        declared = self.declared.get(key, ())
+        return {code for code in received if code in declared} | {
+            range_key(code) for code in received if range_key(code) in declared
+        }
+
+    def declares(self, key: Tuple[str, str], code: str) -> bool:
+        # Код объявлен сам или входит в объявленный диапазон
+        return code in self.numeric.get(key, ()) or range_key(code) in self.declared.get(key, ())
+
+    def ordered(self) -> List[Tuple[str, str]]:
+        # Ключи в порядке вывода таблиц: по пути, затем по методу
+        return sorted(self.declared, key=lambda x: (x[1], x[0]))
+
+    def normalize(self, raw_path: str) -> str:
+        """
+        Конкретный путь -> шаблон спецификации с {param}.
+        Пути вне спецификации: известные сегменты сохраняются, остальные -> {param}.
+        """
+        template = self.trie.match(raw_path)
+        if template:
+            return template
+        segs = [seg if seg in self.vocabulary else '{param}' for seg in raw_path.strip('/').split('/')]
+        return '/' + '/'.join(segs)
+
+
+# Последняя скомпилированная спецификация: (spec, индекс)
+_SPEC_INDEX_CACHE: List[Tuple[dict | None, SpecIndex]] = []
+
+
+def spec_index(openapi_spec: dict | None) -> SpecIndex:
+    """SpecIndex для разобранной спецификации, компилируется один раз на объект spec."""
+    if _SPEC_INDEX_CACHE and _SPEC_INDEX_CACHE[0][0] is openapi_spec:
+        return _SPEC_INDEX_CACHE[0][1]
+    index = SpecIndex.from_spec(openapi_spec)
+    _SPEC_INDEX_CACHE[:] = [(openapi_spec, index)]
+    return index
+
+
+def normalize_path(raw_path: str, spec: SpecIndex = None) -> str:
+    return (spec or spec_index(None)).normalize(raw_path)
+
+
+def extract_used_endpoints(test_file: str, spec: SpecIndex = None) -> Set[Tuple[str, str]]:
+    # Эндпоинты тестов вместе со вспомогательными функциями, которые они вызывают;
+    # функции, не вызываемые ни одним тестом, не учитываются
+    analysis = analyze_test_file(test_file)
+    return {
+        (method, normalize_path(raw_path, spec))
+        for name in analysis.reachable
+        for method, raw_path in analysis.summaries.get(name, ())
     }
-    endpoints: Set[Tuple[str, str]] = set()
-
-    # 4) Process direct calls
-    for pat in direct_patterns:
-        for method, raw in pat.findall(text):
-            m = method.upper()
-            core = raw.strip('/')
-            segs = [seg if seg in fixed_segments else '{param}' for seg in core.split('/')]
-            endpoint = '/' + '/'.join(segs)
-            endpoints.add((m, endpoint))
-            # print(f"Direct call: {m} {endpoint}")  # Debug
-
-    # 5) Process variable-based calls
-    for m1, m2, var in var_call_pattern.findall(text):
-        method = (m1 or m2).upper()
-        if var in url_vars:
-            core = url_vars[var]
-            segs = [seg if seg in fixed_segments else '{param}' for seg in core.split('/')]
-            endpoint = '/' + '/'.join(segs)
-            endpoints.add((method, endpoint))
-            # print(f"Variable call: {m} {endpoint} (var: {var})")  # Debug
-
-    return endpoints
 
 
 def parse_openapi(spec_data: bytes | str) -> dict:
@@ -297,56 +1491,10 @@ def parse_openapi(spec_data: bytes | str) -> dict:
 
 
 def get_pass_fail_rate(report: dict) -> Tuple[int, int]:
-    tests = report.get("tests", [])
-    total = len(tests)
-
-    # Категории для сбора
-    adjusted_4xx_from_200 = []       # assert 200 == 4xx или in [...]
-    suspicious_4xx_eq_200 = []       # assert 4xx == 200
-    all_adjusted = []
-
-    for t in tests:
-        if t.get("outcome") != "passed":
-            call_data = t.get("call", {})
-            raw_longrepr = call_data.get("longrepr", "")
-            text = extract_longrepr_text(raw_longrepr)
-
-            matched = False
-            nodeid = t["nodeid"]
-
-            # Тип 1: assert 200 == 4xx
-            for code in ACCEPTABLE_CODES:
-                if re.search(rf"assert\s+200\s+==\s+{code}", text):
-                    adjusted_4xx_from_200.append(nodeid)
-                    matched = True
-                    break
-
-            # Тип 2: assert 200 in [400, 404] или (400, 415)
-            if not matched:
-                match = re.search(r"assert\s+200\s+in\s+[\[\(]([^\]\)]+)[\]\)]", text)
-                if match:
-                    codes_str = match.group(1)
-                    try:
-                        codes = [int(c.strip()) for c in codes_str.split(",")]
-                        if any(code in ACCEPTABLE_CODES for code in codes):
-                            adjusted_4xx_from_200.append(nodeid)
-                            matched = True
-                    except ValueError:
-                        pass
-
-            # Тип 3: assert 4xx == 200 (подозрительный)
-            if not matched:
-                match = re.search(r"assert\s+(4\d\d)\s+==\s+200", text)
-                if match:
-                    suspicious_4xx_eq_200.append(nodeid)
-
-            # Все зачтённые как пройденные
-            if matched:
-                all_adjusted.append(nodeid)
-
-    # Подсчёт
-    passed = sum(1 for t in tests if t.get("outcome") == "passed" or t["nodeid"] in all_adjusted)
-    failed = total - passed
+    result = classify_report(report)
+    total = result.total
+    adjusted_4xx_from_200 = result.adjusted      # assert 200 == 4xx или in [...]
+    suspicious_4xx_eq_200 = result.suspicious    # assert 4xx == 200
 
     # Отчёт
     print("\n📊 Результаты анализа:")
@@ -355,43 +1503,33 @@ def get_pass_fail_rate(report: dict) -> Tuple[int, int]:
           f"({len(adjusted_4xx_from_200) / total * 100:.1f}%)")
     print(f"🟡 Подозрительные (assert 4xx == 200): {len(suspicious_4xx_eq_200)} "
           f"({len(suspicious_4xx_eq_200) / total * 100:.1f}%)")
-    print(f"✅ Adjusted Pass Rate: {passed}/{total} ({passed / total:.1%})")
+    print(f"✅ Adjusted Pass Rate: {result.passed}/{total} ({result.passed / total:.1%})")
 
-    return passed, failed
+    return result.passed, result.failed
 
 
 
 def measure_api_coverage(
     used_status_codes: Dict[Tuple[str, str], Set[str]],
-    openapi_spec: dict
-) -> None:
+    spec: SpecIndex
+) -> Tuple[int, int]:
     """
     Считает, сколько из всех определённых в spec endpoints
     были «частично покрыты» —
-      1) либо получили хоть один статус-код (ключи used_status_codes пересекаются с Specification_codes),
+      1) либо тесты к ним обращались (ключи used_status_codes пересекаются с Specification_codes:
+         получен код или, при статическом анализе, вызов достижим из теста, в том числе через helper-ы),
       2) либо это «пустые» endpoints (в spec нет реальных response-кодов, только default).
 
     Выводит:
       🧪 API partly Endpoint Coverage: X/Y (Z%)
     """
-    # 1) Собираем из spec все эндпоинты и их реальные коды (без 'default'):
-    Specification_codes: Dict[Tuple[str, str], Set[str]] = {}
-    for raw_path, methods in openapi_spec.get('paths', {}).items():
-        norm = re.sub(r'\{\w+\}', '{param}', raw_path)
-        for method, op in methods.items():
-            m = method.upper()
-            if m not in {'GET', 'POST', 'PUT', 'DELETE', 'PATCH'}:
-                continue
-            codes = {
-                code for code in op.get('responses', {})
-                if code.lower() != 'default'
-            }
-            Specification_codes[(m, norm)] = codes
+    # 1) Все эндпоинты spec и их реальные коды (без 'default') — из индекса
+    Specification_codes = spec.codes
 
     total = len(Specification_codes)
 
     # 2a) Эндпоинты с реальным покрытием: есть и в used_status_codes, и в Specification_codes
-    used_eps = {ep for ep in used_status_codes if ep in Specification_codes and used_status_codes[ep]}
+    used_eps = {ep for ep in used_status_codes if ep in Specification_codes}
 
     # 2b) «Пустые» endpoints (только default)
     empty_eps = {ep for ep, codes in Specification_codes.items() if not codes}
@@ -404,84 +1542,42 @@ def measure_api_coverage(
     pct = (covered / total * 100) if total else 0.0
 
     print(f"\n🧪 API partly Endpoint Coverage: {covered}/{total} ({pct:.1f}%)")
-
-def extract_used_status_codes(test_file: str) -> Dict[Tuple[str, str], Set[str]]:
-    # Read file line by line
-    with open(test_file, encoding='utf-8') as f:
-        lines = f.read().splitlines()
-
-    # Pattern for HTTP calls (requests or session)
-    call_re = re.compile(
-        r'(?:requests|session)\.(get|post|put|delete)\s*\(\s*f?["\']'
-        r'(?:\{?BASE_URL\}?/)?([^"\'\?]+?)(?:\?[^"\']*)?["\']\s*(?:,.*)?\)',
-        re.IGNORECASE
-    )
-    # Pattern for assertions (single value or array)
-    assert_re = re.compile(
-        r'assert\s+(?P<var>\w+)\.status_code\s*(?:==\s*(?P<single_code>\d{3})|in\s*\[(?P<array_codes>[\d,\s]+)\])',
-        re.IGNORECASE
-    )
-
-    # Dictionary to store results
-    used_status_codes: Dict[Tuple[str, str], Set[str]] = {}
-
-    # Fixed path segments
-    fixed_segments = {
-        'pet', 'store', 'order', 'user', 'findByStatus', 'uploadImage',
-        'inventory', 'login', 'logout', 'createWithArray', 'createWithList'
+    return covered, total
+
+def extract_used_status_codes(test_file: str, spec: SpecIndex = None) -> Dict[Tuple[str, str], Set[str]]:
+    # Коды из assert-ов над переменной, в которую записан ответ HTTP-вызова
+    # (или ответ helper-а, который возвращает этот вызов). Эндпоинты, до которых
+    # тесты доходят без проверки кода (в том числе через helper-ы), — с пустым набором
+    used_status_codes: Dict[Tuple[str, str], Set[str]] = {
+        key: set() for key in extract_used_endpoints(test_file, spec)
     }
+    analysis = analyze_test_file(test_file)
+    for site in analysis.call_sites:
+        if site.status_codes and site.function in analysis.reachable:
+            key = (site.method, normalize_path(site.raw_path, spec))
+            used_status_codes.setdefault(key, set()).update(site.status_codes)
+    return used_status_codes
 
-    # Track the last HTTP call to associate with assertions
-    last_call = None
-
-    # Process lines
-    for idx, line in enumerate(lines):
-        # Look for HTTP call
-        call_match = call_re.search(line)
-        if call_match:
-            method = call_match.group(1).upper()  # e.g., "POST"
-            raw_path = call_match.group(2).strip('/')  # e.g., "pet" or "pet/9999"
-
-            # Normalize path
-            segs = raw_path.split('/')
-            norm_segs = [seg if seg in fixed_segments else '{param}' for seg in segs]
-            norm_path = '/' + '/'.join(norm_segs)  # e.g., "/pet" or "/pet/{param}"
-            last_call = (method, norm_path, idx)  # Store call with line index
-            continue
-
-        # Look for assertion if we have a recent HTTP call
-        if last_call:
-            assert_match = assert_re.search(line)
-            if assert_match and idx <= last_call[2] + 2:  # Check within 2 lines
-                var = assert_match.group('var')
-                key = (last_call[0], last_call[1])  # (method, norm_path)
-
-                # Handle single status code
-                if single_code := assert_match.group('single_code'):
-                    used_status_codes.setdefault(key, set()).add(single_code)
-                # Handle array of status codes
-                elif array_codes := assert_match.group('array_codes'):
-                    # Extract numbers from array (e.g., "200, 405" -> ["200", "405"])
-                    codes = [code.strip() for code in array_codes.split(',') if code.strip().isdigit()]
-                    used_status_codes.setdefault(key, set()).update(codes)
 
+def runtime_status_codes(report: dict, spec: SpecIndex = None) -> Dict[Tuple[str, str], Set[str]] | None:
+    """
+    Те же (METHOD, PATH) -> коды, что и extract_used_status_codes, но по реально
+    полученным ответам из отчёта прогона. None, если запросы не записывались
+    (например, прогон через --pytest-subprocess).
+    """
+    tests = report.get("tests", []) if report else []
+    if not tests or any("http" not in t for t in tests):
+        return None
+    used_status_codes: Dict[Tuple[str, str], Set[str]] = {}
+    for t in tests:
+        for method, path, status, _ in t["http"]:
+            key = (method, normalize_path(path, spec))
+            used_status_codes.setdefault(key, set()).add(status)
     return used_status_codes
 
 
-def extract_openapi_responses(spec: dict) -> Dict[Tuple[str, str], Set[str]]:
-    responses = {}
-    for path, methods in spec.get('paths', {}).items():
-        norm_path = re.sub(r'\{\w+\}', '{param}', path)
-        for method, op in methods.items():
-            method = method.upper()
-            if method not in {'GET', 'POST', 'PUT', 'DELETE', 'PATCH'}:
-                continue
-            codes = {
-                code for code in op.get('responses', {}).keys()
-                if code.isdigit()
-            }
-            responses[(method, norm_path)] = codes
-    return responses
+def extract_openapi_responses(spec: SpecIndex) -> Dict[Tuple[str, str], Set[str]]:
+    return spec.numeric
 
 
 def count_tests(test_file: str) -> int:
@@ -495,30 +1591,31 @@ def count_tests(test_file: str) -> int:
         int: Количество тестов.
     """
     try:
-        with open(test_file, encoding='utf-8') as f:
-            return sum(1 for line in f if line.strip().startswith('def test_'))
+        return len(analyze_test_file(test_file).test_names)
     except Exception as e:
         print(f"⚠️ Ошибка при чтении файла тестов: {e}")
         return 1  # Возвращаем 1, чтобы избежать деления на ноль
     
 def analyze_unSpecification_status_codes(
     test_file: str,
-    openapi_spec: dict
+    spec: SpecIndex,
+    used: Dict[Tuple[str, str], Set[str]] = None
 ) -> List[Tuple[str, str, str, str]]:
     """
     Печатает только сводную метрику:
       ❗ Процент незаявленных статус-кодов: X / total_tests (Y%)
     Возвращает список unSpecification_cases для детализации.
     """
-    Specification = extract_openapi_responses(openapi_spec)
-    used     = extract_used_status_codes(test_file)
+    if used is None:
+        used = extract_used_status_codes(test_file, spec)
     total    = count_tests(test_file)
 
     unSpecification = []
     for (m, path), codes in used.items():
-        exp_set = Specification.get((m, path), set())
+        # Объявленные коды, включая диапазоны 4XX (spec.declares)
+        exp_set = spec.codes.get((m, path), set())
         for code in codes:
-            if code not in exp_set:
+            if not spec.declares((m, path), code):
                 unSpecification.append((m, path, code, ",".join(sorted(exp_set))))
 
     cnt = len(unSpecification)
@@ -531,21 +1628,22 @@ def analyze_unSpecification_status_codes(
 
 def analyze_unSpecification_status_det(
     test_file: str,
-    openapi_spec: dict
+    spec: SpecIndex,
+    used: Dict[Tuple[str, str], Set[str]] = None
 ) -> None:
     """
     Детализация для analyze_unSpecification_status_metrics:
       - список незаявленных случаев
     """
     # прямо дублируем логику, без вызова metrics-функции
-    Specification = extract_openapi_responses(openapi_spec)
-    used     = extract_used_status_codes(test_file)
+    if used is None:
+        used = extract_used_status_codes(test_file, spec)
 
     unSpecification = []
     for (method, path), codes in used.items():
-        exp_set = Specification.get((method, path), set())
+        exp_set = spec.codes.get((method, path), set())
         for code in codes:
-            if code not in exp_set:
+            if not spec.declares((method, path), code):
                 unSpecification.append((method, path, code, ",".join(sorted(exp_set))))
 
     if unSpecification:
@@ -555,117 +1653,70 @@ def analyze_unSpecification_status_det(
 
 
 
+def coverage_row(method: str, path: str, used_status_codes: Dict[Tuple[str, str], Set[str]],
+                 spec: SpecIndex) -> dict:
+    """Строка таблицы покрытия для одного эндпоинта spec."""
+    exp_codes = spec.declared[(method, path)]
+    recv = sorted(used_status_codes.get((method, path), []))
+    declared = set(exp_codes)
+    # Полученный 404 покрывает и объявленный 404, и диапазон 4XX
+    actual_declared = sorted(spec.hits((method, path), recv))
+    missing = sorted(declared - set(actual_declared))
+
+    # Обработка случая с единственным default
+    if declared == {'default'}:
+        coverage_pct = 100.0
+        actual_declared = ['default']
+        missing = []
+    else:
+        coverage_pct = (len(actual_declared) / len(declared)) * 100.0 if declared else 0.0
+
+    return {
+        'method': method,
+        'path': path,
+        'Specification': ','.join(exp_codes) or '-',
+        'Expected': ','.join(recv) or '-',
+        'missing': ','.join(missing) or '-',
+        'coverage_pct': coverage_pct,
+    }
+
+
 def show_status_code_coverage_sec(
     used_status_codes: Dict[Tuple[str, str], Set[str]],
-    openapi_spec: dict
-) -> None:
+    spec: SpecIndex
+) -> Tuple[float, Dict[str, float]]:
     """
     Среднее покрытие по разделам граф.
+    Возвращает (среднее по endpoint, {раздел: среднее}).
     """
-    import re
-
-    # Собираем ожидаемые коды по (METHOD, PATH)
-    Specification_codes: Dict[Tuple[str, str], List[str]] = {}
-    for raw_path, methods in openapi_spec.get('paths', {}).items():
-        norm = re.sub(r'\{\w+\}', '{param}', raw_path)
-        for http_method, op_obj in methods.items():
-            m = http_method.upper()
-            if m not in {'GET', 'POST', 'PUT', 'DELETE', 'PATCH'}:
-                continue
-            codes = list(op_obj.get('responses', {}).keys())
-            Specification_codes[(m, norm)] = sorted(codes)
-
-    # Подготовка строк: сортируем по path
-    rows = []
-    for (method, path) in sorted(Specification_codes.keys(), key=lambda x: (x[1], x[0])):
-        exp_codes = Specification_codes[(method, path)]
-        recv = sorted(used_status_codes.get((method, path), []))
-        declared = set(exp_codes)
-        actual_declared = [code for code in recv if code in declared]
-        missing = sorted(declared - set(actual_declared))
-
-        # Обработка случая с единственным default
-        if declared == {'default'}:
-            coverage_pct = 100.0
-            actual_declared = ['default']
-            missing = []
-        else:
-            coverage_pct = (len(actual_declared) / len(declared)) * 100.0 if declared else 0.0
-
-        rows.append({
-            'method': method,
-            'path': path,
-            'Specification': ','.join(exp_codes) or '-',
-            'Expected': ','.join(recv) or '-',
-            'missing': ','.join(missing) or '-',
-            'coverage_pct': coverage_pct,
-        })
+    rows = [coverage_row(method, path, used_status_codes, spec) for method, path in spec.ordered()]
+    pct_by_key = {(r['method'], r['path']): r['coverage_pct'] for r in rows}
 
     # Средние показатели
     avg_pct = sum(r['coverage_pct'] for r in rows) / len(rows) if rows else 0.0
     print(f"\nСредний процент покрытия по endpoint: {avg_pct:.1f}%")
 
-    # Средний процент покрытия по секциям
-    section_stats: Dict[str, List[float]] = {}
-    for r in rows:
-        section = r['path'].split('/')[1] if '/' in r['path'] else r['path']
-        section_stats.setdefault(section, []).append(r['coverage_pct'])
+    # Средний процент покрытия по секциям (группировка — из индекса)
     print("Средний процент покрытия по разделам:")
-    for sec, pct_list in sorted(section_stats.items()):
-        sec_avg = sum(pct_list) / len(pct_list)
+    section_avg: Dict[str, float] = {}
+    for sec, keys in sorted(spec.sections.items()):
+        sec_avg = section_avg[sec] = sum(pct_by_key[key] for key in keys) / len(keys)
         print(f"  - {sec}: {sec_avg:.1f}%")
+    return avg_pct, section_avg
 
 
 
 def show_status_code_coverage(
     used_status_codes: Dict[Tuple[str, str], Set[str]],
-    openapi_spec: dict
-) -> None:
+    spec: SpecIndex
+) -> List[dict]:
     """
-    Для каждого эндпоинта из openapi_spec сравнивает
+    Для каждого эндпоинта из spec сравнивает
     объявленные коды ответов (включая 'default') и те, что реально получили,
-    и выводит таблицу с дополнительной статистикой.
+    и выводит таблицу с дополнительной статистикой. Возвращает строки таблицы.
     """
-    import re
-
-    # Собираем ожидаемые коды по (METHOD, PATH)
-    Specification_codes: Dict[Tuple[str, str], List[str]] = {}
-    for raw_path, methods in openapi_spec.get('paths', {}).items():
-        norm = re.sub(r'\{\w+\}', '{param}', raw_path)
-        for http_method, op_obj in methods.items():
-            m = http_method.upper()
-            if m not in {'GET', 'POST', 'PUT', 'DELETE', 'PATCH'}:
-                continue
-            codes = list(op_obj.get('responses', {}).keys())
-            Specification_codes[(m, norm)] = sorted(codes)
-
     # Подготовка строк: сортируем по path
-    rows = []
-    for (method, path) in sorted(Specification_codes.keys(), key=lambda x: (x[1], x[0])):
-        exp_codes = Specification_codes[(method, path)]
-        recv = sorted(used_status_codes.get((method, path), []))
-        declared = set(exp_codes)
-        actual_declared = [code for code in recv if code in declared]
-        missing = sorted(declared - set(actual_declared))
-
-        # Обработка случая с единственным default
-        if declared == {'default'}:
-            coverage_pct = 100.0
-            actual_declared = ['default']
-            missing = []
-        else:
-            coverage_pct = (len(actual_declared) / len(declared)) * 100.0 if declared else 0.0
-
-        rows.append({
-            'method': method,
-            'path': path,
-            'Specification': ','.join(exp_codes) or '-',
-            'Expected': ','.join(recv) or '-',
-            'missing': ','.join(missing) or '-',
-            'coverage_pct': coverage_pct,
-        })
-
-
+    rows = [coverage_row(method, path, used_status_codes, spec) for method, path in spec.ordered()]
 
     # Вычисляем размеры столбцов
     headers = ['METHOD', 'PATH', 'Specification', 'Expected', 'Missing', 'CovPct']
@@ -703,24 +1754,20 @@ def show_status_code_coverage(
             f"{r['missing']:<{col_widths['Missing']}} | "
             f"{r['coverage_pct']:>{col_widths['CovPct']}.1f}%"
         )
+    return rows
 
 
 
 
 def extract_test_names(test_file: str) -> List[str]:
-    names: List[str] = []
-    for line in open(test_file, encoding='utf-8'):
-        m = re.match(r'\s*def\s+(test_\w+)', line)
-        if m:
-            names.append(m.group(1))
-    return names
+    return list(analyze_test_file(test_file).test_names)
 
 
 
 def measure_full_status_coverage(
     used_status_codes: Dict[Tuple[str, str], Set[str]],
-    openapi_spec: dict
-) -> None:
+    spec: SpecIndex
+) -> Tuple[int, int]:
     """
     Считает процент endpoint-ов, у которых получены ВСЕ ожидаемые коды ответов,
     причём:
@@ -731,19 +1778,8 @@ def measure_full_status_coverage(
     Выводит:
       API Endpoint Coverage: X/Y (Z%)
     """
-    # 1) Собираем из spec все endpoint-ы + реальные коды (без 'default')
-    Specification: Dict[Tuple[str, str], Set[str]] = {}
-    for raw_path, methods in openapi_spec.get('paths', {}).items():
-        norm = re.sub(r'\{\w+\}', '{param}', raw_path)
-        for method, op in methods.items():
-            m = method.upper()
-            if m not in {'GET','POST','PUT','DELETE','PATCH'}:
-                continue
-            codes = {
-                code for code in op.get('responses', {})
-                if code.lower() != 'default'
-            }
-            Specification[(m, norm)] = codes
+    # 1) Все endpoint-ы spec + реальные коды (без 'default') — из индекса
+    Specification = spec.codes
 
     total = len(Specification)  # включает endpoint-ы с пустым Specification
 
@@ -757,115 +1793,972 @@ def measure_full_status_coverage(
             fully += 1
         else:
             recv = used_status_codes.get(ep, set())
-            if exp_codes.issubset(recv):
+            if exp_codes.issubset(spec.hits(ep, recv)):
                 fully += 1
 
     pct = (fully / total * 100) if total else 0.0
     print(f"API Endpoint Coverage: {fully}/{total} ({pct:.1f}%)")
+    return fully, total
+
+
+class CoverageMatrix:
+    """
+    Покрытие многих наборов сразу. Каждая пара (эндпоинт, объявленный код)
+    из SpecIndex — позиция бита; набор тестов — строка булевой матрицы.
+    Коды одного эндпоинта идут подряд, поэтому суммы по эндпоинту считаются
+    разностью кумулятивных сумм, без циклов Python по наборам.
+    """
+
+    def __init__(self, spec: SpecIndex):
+        self.spec = spec
+        self.endpoints = spec.ordered()
+        self.slots: Dict[Tuple[str, str, str], int] = {}
+        starts, nd_mask = [], []
+        for method, path in self.endpoints:
+            starts.append(len(self.slots))
+            for code in spec.declared[(method, path)]:
+                self.slots.setdefault((method, path, code), len(self.slots))
+                nd_mask.append(code.lower() != 'default')
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ends = np.append(self.starts[1:], len(self.slots)).astype(np.int64)
+        self.nd_mask = np.array(nd_mask, dtype=bool)
+        self.declared_count = self.ends - self.starts
+        self.nd_count = self.group_sum(self.nd_mask[None, :])[0]
+        self.default_only = np.array([spec.declared[ep] == ['default'] for ep in self.endpoints], dtype=bool)
+        self.endpoint_pos = {ep: i for i, ep in enumerate(self.endpoints)}
+
+    def group_sum(self, bits: np.ndarray) -> np.ndarray:
+        # (наборы x позиции) -> (наборы x эндпоинты)
+        csum = np.zeros((bits.shape[0], bits.shape[1] + 1), dtype=np.int64)
+        np.cumsum(bits, axis=1, out=csum[:, 1:])
+        return csum[:, self.ends] - csum[:, self.starts]
+
+    def encode(self, used: List[Dict[Tuple[str, str], Set[str]]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Коды наборов -> (биты полученных объявленных кодов, признак «тесты обращались
+        к эндпоинту spec», число незаявленных пар (эндпоинт, код) набора).
+        Полученный код ставит бит своего кода и бит своего диапазона (4XX), если они объявлены.
+        """
+        bits = np.zeros((len(used), len(self.slots)), dtype=bool)
+        touched = np.zeros((len(used), len(self.endpoints)), dtype=bool)
+        undeclared = np.zeros(len(used), dtype=np.int64)
+        for row, used_status_codes in enumerate(used):
+            for (method, path), codes in used_status_codes.items():
+                pos = self.endpoint_pos.get((method, path))
+                if pos is not None:
+                    touched[row, pos] = True
+                for code in codes:
+                    for slot in (self.slots.get((method, path, code)),
+                                 self.slots.get((method, path, range_key(code)))):
+                        if slot is not None:
+                            bits[row, slot] = True
+                    if not self.spec.declares((method, path), code):
+                        undeclared[row] += 1
+        return bits, touched, undeclared
+
+    def full_coverage(self, bits: np.ndarray) -> np.ndarray:
+        # Как measure_full_status_coverage: все коды без default получены (или их нет)
+        return (self.group_sum(bits & self.nd_mask) == self.nd_count).sum(axis=1)
+
+    def partial_coverage(self, touched: np.ndarray) -> np.ndarray:
+        # Как measure_api_coverage: к эндпоинту обращались или в spec только default
+        return (touched | (self.nd_count == 0)).sum(axis=1)
+
+    def endpoint_pct(self, bits: np.ndarray) -> np.ndarray:
+        # Как coverage_row: доля полученных объявленных кодов, «только default» — 100%
+        hits = self.group_sum(bits)
+        pct = np.divide(hits, self.declared_count, out=np.zeros(hits.shape),
+                        where=self.declared_count > 0) * 100.0
+        pct[:, self.default_only] = 100.0
+        return pct
+
+    @staticmethod
+    def mean(values: np.ndarray) -> np.ndarray:
+        # Последовательная сумма слева направо (cumsum), как sum() в печатающих функциях,
+        # чтобы значения на границе округления .x5 совпадали с ними
+        if values.shape[1] == 0:
+            return np.zeros(values.shape[0])
+        return np.cumsum(values, axis=1)[:, -1] / values.shape[1]
+
+    def section_pct(self, bits: np.ndarray) -> Dict[str, np.ndarray]:
+        pct = self.endpoint_pct(bits)
+        return {
+            section: self.mean(pct[:, [self.endpoint_pos[key] for key in keys]])
+            for section, keys in sorted(self.spec.sections.items())
+        }
+
+
+
+def batch_coverage(test_files: List[str], spec: SpecIndex,
+                   used: List[Dict[Tuple[str, str], Set[str]]] = None) -> Dict[str, np.ndarray]:
+    """
+    Метрики покрытия для списка файлов тестов одной векторной операцией на метрику.
+    used — коды по файлам (например, из записей evaluate_file); по умолчанию
+    статический анализ.
+    """
+    matrix = CoverageMatrix(spec)
+    if used is None:
+        used = [extract_used_status_codes(f, spec) for f in test_files]
+    bits, touched, undeclared = matrix.encode(used)
+    total = len(matrix.endpoints)
+    pct = matrix.endpoint_pct(bits)
+    return {
+        "total": np.full(len(test_files), total),
+        "full": matrix.full_coverage(bits),
+        "partial": matrix.partial_coverage(touched),
+        "endpoint_avg": matrix.mean(pct),
+        "undeclared": undeclared,
+        "tests": np.array([count_tests(f) for f in test_files]),
+        **{f"section:{sec}": values for sec, values in matrix.section_pct(bits).items()},
+    }
+
+
+def print_batch_coverage(test_files: List[str], spec: SpecIndex,
+                         used: List[Dict[Tuple[str, str], Set[str]]] = None) -> None:
+    """Сводная таблица покрытия по всем файлам batch-прогона."""
+    if not spec.declared or not test_files:
+        return
+    cov = batch_coverage(test_files, spec, used)
+    width = max(len(f) for f in test_files)
+    print(f"\n📊 Покрытие по наборам ({len(test_files)}):")
+    print(f"{'FILE':<{width}} | Full       | Partly     | Undeclared")
+    for i, f in enumerate(test_files):
+        total = cov["total"][i] or 1
+        tests = cov["tests"][i] or 1
+        print(f"{f:<{width}} | {cov['full'][i] / total * 100:>9.1f}% "
+              f"| {cov['partial'][i] / total * 100:>9.1f}% "
+              f"| {cov['undeclared'][i] / tests * 100:>9.1f}%")
 
 
 
 
 
-def detect_flaky_tests(test_names: List[str], module_path: str = None, repeat: int = 3) -> List[str]:
+def base_test_name(item) -> str:
+    # Для параметризованных тестов nodeid содержит [...], имя функции — originalname
+    return getattr(item, "originalname", None) or item.name
+
+
+def outcome_from_reports(reports) -> str:
+    # Сводим setup/call/teardown к одному исходу, как это делает pytest-json-report
+    if any(rep.failed for rep in reports):
+        return "failed"
+    if any(rep.skipped for rep in reports):
+        return "skipped"
+    return "passed"
+
+
+class RerunCollector:
     """
-    Запускает тесты через pytest несколько раз для выявления флаки-тестов.
+    pytest-плагин для одной сессии: модуль собирается один раз,
+    затем каждый выбранный тест выполняется repeat раз по кругу.
+    Исходы и длительности хранятся в памяти: nodeid -> [outcome, ...], [секунды, ...].
     """
-    flaky: List[str] = []
+
+    def __init__(self, test_names: List[str], repeat: int = 3):
+        self.test_names = set(test_names)
+        self.repeat = repeat
+        self.outcomes: Dict[str, List[str]] = defaultdict(list)
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self.node_names: Dict[str, str] = {}
+
+    def pytest_collection_modifyitems(self, config, items):
+        items[:] = [item for item in items if base_test_name(item) in self.test_names]
+        self.node_names = {item.nodeid: base_test_name(item) for item in items}
+
+    def run_item(self, item):
+        if self.outcomes.get(item.nodeid):
+            # Сбрасываем фикстуры функции перед повторным запуском
+            item._initrequest()
+        reports = runtestprotocol(item, log=False, nextitem=None)
+        self.outcomes[item.nodeid].append(outcome_from_reports(reports))
+        self.durations[item.nodeid].append(sum(rep.duration for rep in reports))
+        return reports
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtestloop(self, session):
+        for _ in range(self.repeat):
+            for item in session.items:
+                self.run_item(item)
+        return True
+
+
+def failure_signature(reports) -> str:
+    # Короткое описание падения: первая строка reprcrash, без полного traceback
+    for rep in reports:
+        if rep.failed:
+            crash = getattr(rep.longrepr, "reprcrash", None)
+            return crash.message.splitlines()[0] if crash and crash.message else str(rep.longrepr)[:200]
+    return ""
+
+
+class AdaptiveRerunCollector(RerunCollector):
+    """
+    Адаптивные повторы вместо repeat прогонов каждого теста:
+      - тест останавливается, как только его исходы разошлись (он флаки);
+      - тест с одинаковыми исходами, одной причиной падения и ровной длительностью
+        останавливается после min_runs прогонов (по умолчанию 2);
+      - «шумные» тесты (разброс длительности > cv_threshold или разные причины
+        падения) получают дополнительные прогоны до max_runs из отдельного бюджета
+        extra_budget (по умолчанию — по одному прогону на тест), по кругу,
+        начиная с тестов с наименьшим числом прогонов.
+    Разброс длительности меньше min_jitter секунд шумом не считается.
+    """
+
+    def __init__(self, test_names: List[str], repeat: int = 3, min_runs: int = 2,
+                 max_runs: int = 6, extra_budget: int = None, cv_threshold: float = 0.5,
+                 min_jitter: float = 0.05):
+        super().__init__(test_names, repeat)
+        # Двух прогонов достаточно, чтобы оценить разброс длительности
+        self.min_runs = max(min_runs, 2)
+        self.max_runs = max(max_runs, self.min_runs)
+        self.extra_budget = extra_budget
+        self.cv_threshold = cv_threshold
+        self.min_jitter = min_jitter
+        self.signatures: Dict[str, Set[str]] = defaultdict(set)
+        self.executed = 0
+        self.extra_executed = 0
+
+    def is_noisy(self, nodeid: str) -> bool:
+        if len(self.signatures[nodeid]) > 1:
+            return True
+        return duration_cv(self.durations[nodeid], self.min_jitter) > self.cv_threshold
+
+    def diverged(self, nodeid: str) -> bool:
+        return len({r == "passed" for r in self.outcomes[nodeid]}) > 1
+
+    def next_round(self, items: list, extra_budget: int) -> list:
+        """Тесты для следующего круга: сначала обязательные min_runs, затем «шумные» в пределах extra_budget."""
+        undecided = [item for item in items if not self.diverged(item.nodeid)]
+        required = [item for item in undecided if len(self.outcomes[item.nodeid]) < self.min_runs]
+        if required:
+            return required
+        extra = [item for item in undecided
+                 if len(self.outcomes[item.nodeid]) < self.max_runs and self.is_noisy(item.nodeid)]
+        extra.sort(key=lambda item: len(self.outcomes[item.nodeid]))
+        return extra[:max(extra_budget - self.extra_executed, 0)]
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtestloop(self, session):
+        extra_budget = len(session.items) if self.extra_budget is None else self.extra_budget
+        while True:
+            batch = self.next_round(session.items, extra_budget)
+            if not batch:
+                return True
+            for item in batch:
+                if len(self.outcomes[item.nodeid]) >= self.min_runs:
+                    self.extra_executed += 1
+                reports = self.run_item(item)
+                self.executed += 1
+                if self.outcomes[item.nodeid][-1] == "failed":
+                    self.signatures[item.nodeid].add(failure_signature(reports))
+
+
+def duration_cv(durations: List[float], min_jitter: float = 0.05) -> float:
+    """Коэффициент вариации длительностей прогонов; разброс меньше min_jitter секунд — 0."""
+    if len(durations) < 2:
+        return 0.0
+    mean = sum(durations) / len(durations)
+    std = (sum((d - mean) ** 2 for d in durations) / len(durations)) ** 0.5
+    if mean <= 0 or std <= min_jitter:
+        return 0.0
+    return std / mean
+
+
+def verdict_confidence(results: List[str], durations: List[float] = (), flip_rate: float = 0.2,
+                       min_jitter: float = 0.05) -> float:
+    """
+    Уверенность вердикта по вектору исходов и длительностям прогонов.
+    Разошедшиеся исходы — доказательство флаки (1.0).
+    Для стабильного теста — вероятность, что тест, меняющий исход с частотой flip_rate,
+    был бы пойман за len(results) прогонов: 1 - ((1-p)^n + p^n), делённая на
+    1 + коэффициент вариации длительностей: неровный тест — менее уверенный вердикт.
+    """
+    n = len(results)
+    if len({r == "passed" for r in results}) > 1:
+        return 1.0
+    detection = 1.0 - ((1 - flip_rate) ** n + flip_rate ** n)
+    return detection / (1.0 + duration_cv(list(durations), min_jitter))
+
+
+def flaky_from_outcomes(test_names: List[str], outcomes: Dict[str, List[str]],
+                        node_names: Dict[str, str]) -> List[str]:
+    """
+    Тест флаки, если хотя бы у одного его nodeid исходы (passed / не passed) различаются.
+    Порядок результата совпадает с порядком test_names.
+    """
+    unstable = {
+        node_names[nodeid]
+        for nodeid, results in outcomes.items()
+        if len({r == "passed" for r in results}) > 1
+    }
+    return [name for name in test_names if name in unstable]
+
+
+# (исходы по nodeid, nodeid -> имя тестовой функции, длительности прогонов по nodeid)
+RerunResult = Tuple[Dict[str, List[str]], Dict[str, str], Dict[str, List[float]]]
+
+
+def detect_flaky_tests_in_session(test_names: List[str], module_path: str = None, repeat: int = 3,
+                                  adaptive: bool = False) -> RerunResult:
+    """
+    Однократный сбор модуля и repeat прогонов каждого теста в одной pytest-сессии.
+    adaptive=True — число прогонов выбирает AdaptiveRerunCollector.
+    Возвращает RerunResult.
+    """
+    collector = AdaptiveRerunCollector(test_names, repeat) if adaptive else RerunCollector(test_names, repeat)
+    pytest_main_isolated([module_path or TEST_FILE], [collector])
+    return dict(collector.outcomes), collector.node_names, dict(collector.durations)
+
+
+def detect_flaky_tests_subprocess(test_names: List[str], module_path: str = None, repeat: int = 3,
+                                  report_dir: str = ".") -> RerunResult:
+    """
+    Отдельный подпроцесс pytest на каждый повтор каждого теста
+    (при USE_WARM_POOL — форк прогретого форк-сервера).
+    Отчёты пишутся в report_dir и удаляются сразу после чтения.
+    """
+    outcomes: Dict[str, List[str]] = defaultdict(list)
+    durations: Dict[str, List[float]] = defaultdict(list)
     for name in test_names:
-        results = []
         for i in range(repeat):
-            report_file = f"report_{name}_{i}.json"
-            report = run_pytest_json(test_name=name, report_file=report_file)
+            report_file = os.path.join(report_dir, f"report_{name}_{i}.json")
+            if USE_WARM_POOL:
+                report = run_pytest_warm(test_name=name, module_path=module_path)
+            else:
+                report = run_pytest_json(test_name=name, report_file=report_file, module_path=module_path)
             tests = report.get("tests", [])
             outcome = tests[0].get("outcome") if tests else "failed"
-            results.append(outcome == "passed")
+            outcomes[name].append(outcome)
+            durations[name].append(tests[0].get("duration", 0.0) if tests else 0.0)
             # Clean up report file
             if os.path.exists(report_file):
                 os.remove(report_file)
-        if len(set(results)) > 1:
-            flaky.append(name)
+    return dict(outcomes), {name: name for name in outcomes}, dict(durations)
+
+
+def collect_rerun_outcomes(test_names: List[str], module_path: str, repeat: int,
+                           in_session: bool, adaptive: bool = False) -> RerunResult:
+    """
+    Задание одного воркера: повторные прогоны своей части тестов.
+    У каждого воркера собственный временный каталог для отчётов.
+    Адаптивная политика доступна только в режиме in_session.
+    """
+    if in_session:
+        return detect_flaky_tests_in_session(test_names, module_path, repeat, adaptive)
+    with tempfile.TemporaryDirectory(prefix="flaky_") as report_dir:
+        return detect_flaky_tests_subprocess(test_names, module_path, repeat, report_dir)
+
+
+def test_fingerprints(test_file: str) -> Dict[str, str]:
+    """
+    Хэш каждого теста по нормализованному AST (без позиций и форматирования)
+    вместе с транзитивными зависимостями уровня модуля: вспомогательными функциями
+    (create_test_pet, generate_pet_data, ...), фикстурами и глобальными константами.
+    Класс Test* хэшируется целиком, как один тест.
+    Возвращает {имя теста или класса: sha256} в порядке файла.
+    """
+    tree = analyze_test_file(test_file).tree
+    if tree is None:
+        return {}
+
+    defs: Dict[str, ast.AST] = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            defs[node.name] = node
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                for name in ast.walk(target):
+                    if isinstance(name, ast.Name):
+                        defs[name.id] = node
+
+    def direct_deps(name: str) -> Set[str]:
+        node = defs[name]
+        refs = {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+        # Аргументы функций и методов могут быть фикстурами модуля
+        refs |= {a.arg for a in ast.walk(node) if isinstance(a, ast.arg)}
+        return {ref for ref in refs if ref in defs and ref != name}
+
+    fingerprints: Dict[str, str] = {}
+    for name, node in defs.items():
+        is_test = name.startswith("test_") and isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+        if not is_test and not (name.startswith("Test") and isinstance(node, ast.ClassDef)):
+            continue
+        closure, stack = {name}, [name]
+        while stack:
+            for dep in direct_deps(stack.pop()):
+                if dep not in closure:
+                    closure.add(dep)
+                    stack.append(dep)
+        dumped = {ast.dump(defs[dep]) for dep in closure}
+        fingerprints[name] = hashlib.sha256("\n".join(sorted(dumped)).encode('utf-8')).hexdigest()
+    return fingerprints
+
+
+def verdict_cache_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, f"{key}.json")
+
+
+def load_verdict_cache(cache_dir: str, keys: List[str]) -> Dict[str, dict]:
+    """Записи кэша вердиктов для указанных ключей (отсутствующие пропускаются)."""
+    cache: Dict[str, dict] = {}
+    for key in keys:
+        try:
+            with open(verdict_cache_path(cache_dir, key), encoding='utf-8') as f:
+                cache[key] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+    return cache
+
+
+def save_verdict_cache(cache_dir: str, cache: Dict[str, dict]) -> None:
+    # Каждая запись — отдельный файл, заменяется атомарно
+    os.makedirs(cache_dir, exist_ok=True)
+    for key, entry in cache.items():
+        dump_json_atomic(verdict_cache_path(cache_dir, key), entry)
+
+
+def detect_flaky_tests(test_names: List[str], module_path: str = None, repeat: int = 3,
+                       in_session: bool = True, jobs: int = 1, adaptive: bool = False,
+                       cache_dir: str = None) -> List[str]:
+    """
+    Запускает тесты через pytest несколько раз для выявления флаки-тестов.
+    in_session=True — все повторы внутри одной pytest-сессии (быстро),
+    in_session=False — отдельный подпроцесс pytest на каждый повтор каждого теста.
+    jobs > 1 — тесты делятся между процессами, результаты объединяются.
+    adaptive=True — ранняя остановка и доп. прогоны для «шумных» тестов,
+    печатается уверенность каждого вердикта.
+    cache_dir — кэш вердиктов по AST-хэшу теста: неизменённые тесты не перезапускаются.
+    """
+    module_path = module_path or TEST_FILE
+
+    cache: Dict[str, dict] = {}
+    cache_keys: Dict[str, str] = {}
+    cached_names: Set[str] = set()
+    if cache_dir:
+        policy = f"{repeat}_{'adaptive' if adaptive else 'fixed'}"
+        cache_keys = {name: f"{fp}_{policy}" for name, fp in test_fingerprints(module_path).items()}
+        cache = load_verdict_cache(cache_dir, [cache_keys[name] for name in test_names if name in cache_keys])
+        cached_names = {name for name in test_names if cache_keys.get(name) in cache}
+    to_run = [name for name in test_names if name not in cached_names]
+    shards = [to_run[i::jobs] for i in range(max(jobs, 1)) if to_run[i::jobs]]
+
+    outcomes: Dict[str, List[str]] = {}
+    node_names: Dict[str, str] = {}
+    durations: Dict[str, List[float]] = {}
+    if len(shards) > 1:
+        with process_pool(len(shards)) as pool:
+            futures = [
+                pool.submit(collect_rerun_outcomes, shard, module_path, repeat, in_session, adaptive)
+                for shard in shards
+            ]
+            for future in futures:
+                shard_outcomes, shard_names, shard_durations = future.result()
+                outcomes.update(shard_outcomes)
+                node_names.update(shard_names)
+                durations.update(shard_durations)
+    elif shards:
+        outcomes, node_names, durations = collect_rerun_outcomes(to_run, module_path, repeat, in_session, adaptive)
+    executed, fresh_nodes = sum(len(r) for r in outcomes.values()), len(outcomes)
+
+    if cache_dir:
+        # В кэше nodeid хранится без пути модуля: vN_main.py разных версий делят вердикты
+        fresh: Dict[str, dict] = {}
+        for nodeid, results in outcomes.items():
+            name = node_names[nodeid]
+            if name in cache_keys:
+                entry = fresh.setdefault(cache_keys[name], {"name": name, "nodes": {}, "durations": {}})
+                entry["nodes"][nodeid.split("::", 1)[-1]] = results
+                entry["durations"][nodeid.split("::", 1)[-1]] = durations.get(nodeid, [])
+        for name in cached_names:
+            entry = cache[cache_keys[name]]
+            for suffix, results in entry["nodes"].items():
+                outcomes[f"{module_path}::{suffix}"] = results
+                node_names[f"{module_path}::{suffix}"] = name
+                durations[f"{module_path}::{suffix}"] = entry.get("durations", {}).get(suffix, [])
+        save_verdict_cache(cache_dir, fresh)
+        print(f"🗃️ Вердикты из кэша: {len(cached_names)}, перезапущено тестов: {len(to_run)}")
+
+    flaky = flaky_from_outcomes(test_names, outcomes, node_names)
     print(f"⚠️ Flaky tests: {flaky or ['None']}")
+    if adaptive:
+        print(f"🔁 Прогонов выполнено: {executed} "
+              f"(фиксированная схема: {repeat * fresh_nodes})")
+        print("📈 Уверенность вердиктов:")
+        for nodeid, results in outcomes.items():
+            verdict = "flaky" if node_names[nodeid] in flaky else "stable"
+            print(f"   - {nodeid}: {verdict}, прогонов {len(results)}, "
+                  f"уверенность {verdict_confidence(results, durations.get(nodeid, [])):.2f}")
     return flaky
 
 
+def probe_spec(url: str) -> bytes | None:
+    try:
+        r = requests.get(url, timeout=5)
+        ctype = r.headers.get('Content-Type', '')
+        if r.status_code == 200 and ('application/json' in ctype or r.text.lstrip().startswith(('{', 'swagger:', 'openapi:'))):
+            return r.content
+    except requests.RequestException:
+        pass
+    return None
+
+
 def fetch_spec(base_url: str, paths: List[str]) -> bytes | None:
-    for path in paths:
-        url = base_url.rstrip('/') + path
-        try:
-            r = requests.get(url, timeout=5)
-            ctype = r.headers.get('Content-Type', '')
-            if r.status_code == 200 and ('application/json' in ctype or r.text.lstrip().startswith(('{', 'swagger:'))):
-                print(f"✅ Spec found at: {url}")
-                return r.content
-        except requests.RequestException:
-            pass
+    """
+    Опрашивает все стандартные пути одновременно и берёт первый валидный ответ;
+    остальные запросы не дожидаемся. Худший случай — один таймаут, а не len(paths).
+    """
+    urls = [base_url.rstrip('/') + path for path in paths]
+    pool = ThreadPoolExecutor(max_workers=len(urls) or 1)
+    try:
+        futures = {pool.submit(probe_spec, url): url for url in urls}
+        for future in as_completed(futures):
+            content = future.result()
+            if content is not None:
+                print(f"✅ Spec found at: {futures[future]}")
+                return content
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
     print("❌ Spec not found on standard paths.")
     return None
 
 
-# def calculate_cyclomatic_complexity(path: str) -> int:
-#     code = open(path, 'r', encoding='utf-8').read()
-#     visitor = ComplexityVisitor()
-#     visitor.visit(ast.parse(code))
-#     max_c = 0
-#     for func in visitor.functions:
-#         max_c = max(max_c, func.complexity)
-#     print(f" Cyclomatic complexity: {max_c}")
-#     return max_c
+def load_spec_index(cache_dir: str) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(cache_dir, "index.json"), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def load_cached_spec(base_url: str, cache_dir: str = SPEC_CACHE_DIR) -> dict | None:
+    """Разобранная спецификация из кэша, без обращения к сети. None, если её нет."""
+    entry = load_spec_index(cache_dir).get(base_url)
+    if not entry:
+        return None
+    try:
+        with open(os.path.join(cache_dir, entry["sha256"] + ".json"), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_cached_spec(base_url: str, spec_bytes: bytes, parsed: dict, cache_dir: str = SPEC_CACHE_DIR) -> None:
+    """
+    Кладёт исходные байты и разобранную форму под именем sha256 содержимого
+    и обновляет запись base URL в index.json (запись через os.replace).
+    """
+    digest = hashlib.sha256(spec_bytes).hexdigest()
+    os.makedirs(cache_dir, exist_ok=True)
+    raw_path = os.path.join(cache_dir, digest + ".raw")
+    if not os.path.exists(raw_path):
+        # .raw пишется последним: если он есть, то и .json записан целиком
+        dump_json_atomic(os.path.join(cache_dir, digest + ".json"), parsed, default=str)
+        tmp = f"{raw_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(spec_bytes)
+        os.replace(tmp, raw_path)
+    index = load_spec_index(cache_dir)
+    index[base_url] = {"sha256": digest, "size": len(spec_bytes), "fetched_at": int(time.time())}
+    dump_json_atomic(os.path.join(cache_dir, "index.json"), index, indent=1)
+
+
+def get_spec(base_url: str, paths: List[str], refresh: bool = False, cache_dir: str | None = SPEC_CACHE_DIR) -> dict:
+    """
+    Спецификация для base_url: из локального кэша без сетевых запросов, а с сервера —
+    только при пустом кэше или refresh=True. Если при refresh сервер недоступен,
+    используется закэшированная копия. cache_dir=None — кэш не используется.
+    """
+    if cache_dir and not refresh:
+        parsed = load_cached_spec(base_url, cache_dir)
+        if parsed is not None:
+            print(f"✅ Spec loaded from cache: {base_url}")
+            return parsed
+
+    spec_bytes = fetch_spec(base_url, paths)
+    if spec_bytes is None:
+        parsed = load_cached_spec(base_url, cache_dir) if cache_dir else None
+        if parsed is not None:
+            print(f"⚠️ Используется закэшированная спецификация: {base_url}")
+            return parsed
+        return {}
+    parsed = parse_openapi(spec_bytes)
+    if cache_dir and parsed:
+        save_cached_spec(base_url, spec_bytes, parsed, cache_dir)
+    return parsed
+
+
+def calculate_cyclomatic_complexity(path: str) -> int:
+    # Из общего AST-прохода analyze_test_file, без повторного разбора файла
+    max_c = max((m.complexity for m in analyze_test_file(path).metrics.values()), default=0)
+    print(f" Cyclomatic complexity: {max_c}")
+    return max_c
+
+
+def test_size_metrics(path: str) -> Dict[str, float]:
+    """
+    Метрики размера тестов из того же прохода: средняя сложность и длина теста,
+    среднее и максимальное число HTTP-запросов на тест (включая helper-ы).
+    """
+    analysis = analyze_test_file(path)
+    # Каждое определение test_* (в том числе переопределённое) учитывается один раз
+    tests = [m for (qualname, _), m in analysis.metrics.items() if qualname.rsplit('.', 1)[-1].startswith('test_')]
+    count = len(tests) or 1
+    return {
+        "avg_complexity": sum(m.complexity for m in tests) / count,
+        "avg_test_length": sum(m.length for m in tests) / count,
+        "avg_requests_per_test": sum(m.requests for m in tests) / count,
+        "max_requests_per_test": max((m.requests for m in tests), default=0),
+    }
+
+
+def analyze_test_size(path: str) -> Dict[str, float]:
+    sizes = test_size_metrics(path)
+    print(f"📏 Средняя длина теста: {sizes['avg_test_length']:.1f} строк, "
+          f"средняя сложность: {sizes['avg_complexity']:.2f}")
+    print(f"🌐 Запросов на тест: {sizes['avg_requests_per_test']:.2f} "
+          f"(максимум {sizes['max_requests_per_test']})")
+    return sizes
 
 
-def analyze_style(path: str) -> float:
+def pylint_rcfile() -> str | None:
+    # Файл конфигурации, который возьмёт pylint: --rcfile из PYLINT_ARGS или первый
+    # найденный им самим (каталог и родительские пакеты, pyproject.toml, $PYLINTRC, ~/.pylintrc, /etc)
+    for arg in PYLINT_ARGS:
+        if arg.startswith("--rcfile="):
+            return arg.split("=", 1)[1]
+    return next((str(path) for path in find_default_config_files()), None)
+
+
+def pylint_config_hash() -> str:
+    # Версия pylint, аргументы и содержимое файла конфигурации, который pylint использует
+    h = hashlib.sha256(f"{pylint_version}|{' '.join(PYLINT_ARGS)}".encode())
+    rcfile = pylint_rcfile()
+    if rcfile:
+        try:
+            with open(rcfile, "rb") as f:
+                h.update(rcfile.encode() + b"\0" + f.read())
+        except OSError:
+            pass
+    return h.hexdigest()
+
+
+def style_cache_path(path: str, cache_dir: str) -> str:
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return os.path.join(cache_dir, f"{digest}_{pylint_config_hash()[:16]}.json")
+
+
+def pylint_score(path: str, cache_dir: str | None = STYLE_CACHE_DIR) -> float:
+    """
+    Оценка pylint для файла без печати. Берётся из кэша, если файл и конфигурация
+    pylint не менялись; иначе считается и сохраняется (dump_json_atomic — безопасно
+    для параллельных воркеров).
+    """
+    cache_path = style_cache_path(path, cache_dir) if cache_dir else None
+    if cache_path:
+        try:
+            with open(cache_path, encoding='utf-8') as f:
+                return json.load(f)["score"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
     # Перенаправляем весь вывод Pylint в буфер и не показываем его
     buffer = StringIO()
     reporter = TextReporter(buffer)
-    run = Run([path, '--score=yes'], reporter=reporter, exit=False)
+    run = Run([path, *PYLINT_ARGS], reporter=reporter, exit=False)
     score = run.linter.stats.global_note
+
+    if cache_path and isinstance(score, (int, float)):
+        os.makedirs(cache_dir, exist_ok=True)
+        dump_json_atomic(cache_path, {"file": path, "score": score})
+    return score
+
+
+def analyze_style(path: str, cache_dir: str | None = STYLE_CACHE_DIR) -> float:
+    score = pylint_score(path, cache_dir)
     print(f"Style Score: {score:.1f}/10")
     return score
 
 
-if __name__ == "__main__":
-    for TEST_FILE in TEST_FILEs:
-        print(TEST_FILE)
-        # 1) Получаем и разбираем spec
-        spec_bytes = fetch_spec(BASE_URL, ENDPOINTS)
-        parsed = parse_openapi(spec_bytes) if spec_bytes else {}
+def pylint_scores(paths: List[str], cache_dir: str | None = STYLE_CACHE_DIR) -> Dict[str, float]:
+    # Несколько файлов в одном процессе: astroid прогревается один раз
+    return {path: pylint_score(path, cache_dir) for path in paths}
 
-        # 8) Pylint
-        analyze_style(TEST_FILE)
 
+def score_styles(paths: List[str], jobs: int, cache_dir: str | None = STYLE_CACHE_DIR) -> Dict[str, float]:
+    """
+    Оценки pylint для многих файлов. Закэшированные читаются сразу, остальные
+    делятся на не более min(jobs, число CPU) частей, по процессу на часть: первый
+    запуск pylint в процессе — это секунды прогрева astroid, поэтому файлы
+    не раздаются воркерам по одному.
+    """
+    scores: Dict[str, float] = {}
+    pending = []
+    for path in paths:
+        cache_path = style_cache_path(path, cache_dir) if cache_dir else None
+        try:
+            with open(cache_path, encoding='utf-8') as f:
+                scores[path] = json.load(f)["score"]
+        except (TypeError, FileNotFoundError, json.JSONDecodeError, KeyError):
+            pending.append(path)
+
+    workers = min(jobs, os.cpu_count() or 1, len(pending))
+    if workers <= 1:
+        scores.update(pylint_scores(pending, cache_dir))
+        return scores
+    chunks = [pending[i::workers] for i in range(workers)]
+    with process_pool(workers) as pool:
+        for result in pool.map(pylint_scores, chunks, [cache_dir] * workers):
+            scores.update(result)
+    return scores
+
+
+def metrics_log_path(test_file: str) -> str:
+    # Qwen/v8_main.py -> Qwen/v8_metrics_log.txt
+    root = test_file[:-len("_main.py")] if test_file.endswith("_main.py") else os.path.splitext(test_file)[0]
+    return f"{root}_metrics_log.txt"
+
+
+def metrics_json_path(test_file: str) -> str:
+    # Qwen/v8_main.py -> Qwen/v8_metrics.json
+    return metrics_log_path(test_file)[:-len("_log.txt")] + ".json"
 
-        # 2) Запускаем pytest и считаем pass/fail
-        report = run_pytest_json()
-        get_pass_fail_rate_firs(report)
 
-        # 3) Извлекаем все вызовы и коды
-        used = extract_used_endpoints(TEST_FILE)
-        used_status_codes = extract_used_status_codes(TEST_FILE)
+def percent(part: int, total: int) -> float:
+    return part / total * 100 if total else 0.0
+
+
+def save_metrics_record(test_file: str, record: dict) -> str:
+    """Записывает метрики файла в vN_metrics.json рядом с логом (атомарно)."""
+    path = metrics_json_path(test_file)
+    dump_json_atomic(path, record, indent=1)
+    return path
+
+
+def failure_message(test: dict) -> str | None:
+    """
+    Краткая причина падения теста для хранилища результатов: записанные
+    status-assert-ы, иначе первая строка crash (KeyError, assert над JSON, таймаут),
+    иначе последняя непустая строка longrepr.
+    """
+    if test.get("outcome") == "passed":
+        return None
+    if test.get("status_asserts"):
+        return "; ".join(f"assert {left} {op} {right}" for left, op, right in test["status_asserts"])
+    call = test.get("call", {})
+    message = (call.get("crash") or {}).get("message")
+    if message:
+        return message.splitlines()[0]
+    lines = [line for line in extract_longrepr_text(call.get("longrepr", "")).splitlines() if line.strip()]
+    return lines[-1].strip() if lines else None
+
+
+def evaluate_file(test_file: str, parsed: dict, args: argparse.Namespace) -> dict:
+    """
+    Полный набор метрик для одного файла тестов (спецификация уже разобрана).
+    Печатает отчёт и возвращает те же метрики одной записью (см. save_metrics_record).
+    """
+    global TEST_FILE, USE_WARM_POOL
+    TEST_FILE = test_file
+    # В воркерах batch-режима модуль импортирован заново: переносим настройки явно
+    USE_WARM_POOL = args.warm_pool
+    started = time.time()
+
+    # 8) Pylint
+    style_score = analyze_style(TEST_FILE, args.style_cache or None)
+    complexity = calculate_cyclomatic_complexity(TEST_FILE)
+    sizes = analyze_test_size(TEST_FILE)
+
+
+    # 2) Запускаем pytest и считаем pass/fail
+    if args.pytest_subprocess and USE_WARM_POOL:
+        report = run_pytest_warm()
+    elif args.pytest_subprocess:
+        with tempfile.TemporaryDirectory(prefix="report_") as report_dir:
+            report = run_pytest_json(report_file=os.path.join(report_dir, "report.json"))
+    else:
+        base_path = args.base or (previous_version(TEST_FILE) if args.incremental else None)
+        report = run_pytest_incremental(base_path=base_path, jobs=args.jobs)
+    save_report_state(TEST_FILE, report)
+    passed, failed = get_pass_fail_rate_firs(report)
+
+    # 3) Извлекаем все вызовы и коды
+    index = spec_index(parsed)
+    used_status_codes = None
+    if args.runtime_coverage:
+        used_status_codes = runtime_status_codes(report, index)
+        if used_status_codes is None:
+            print("⚠️ Запросы прогона не записаны, покрытие по статическому анализу")
+    if used_status_codes is None:
+        used_status_codes = extract_used_status_codes(TEST_FILE, index)
+
+    # 6) Полное покрытие **по статус-кодам**
+    fully, total_endpoints = measure_full_status_coverage(used_status_codes, index)
+
+
+    # Покрытие по разделам
+    endpoint_avg, section_avg = show_status_code_coverage_sec(used_status_codes, index)
+
+    # 5) Частичное покрытие **по endpoint-ам** (метод+путь)
+    partly, _ = measure_api_coverage(used_status_codes, index)
+    undeclared = analyze_unSpecification_status_codes(TEST_FILE, index, used_status_codes)
+
+    get_pass_fail_rate_sec(report)
+
+
+    # 4) Таблица по всем status-кодам
+    rows = show_status_code_coverage(used_status_codes, index)
+    analyze_unSpecification_status_det(TEST_FILE, index, used_status_codes)
+    print_pass_fail_details(report)
+
+
+    # Долго, но надежно
+    names = extract_test_names(TEST_FILE)
+    flaky = detect_flaky_tests(names, jobs=args.flaky_jobs, adaptive=args.flaky_adaptive,
+                               cache_dir=args.flaky_cache or None)
+
+    # Те же метрики, что в тексте отчёта; ключи процентных метрик совпадают с zplt.py
+    result = classify_report(report)
+    test_count = count_tests(TEST_FILE)
+    return {
+        "file": TEST_FILE,
+        "model": os.path.basename(os.path.dirname(os.path.abspath(TEST_FILE))),
+        "started": started,
+        "duration": time.time() - started,
+        "style_score": style_score,
+        "cyclomatic_complexity": complexity,
+        **sizes,
+        "tests": result.total,
+        "passed": passed,
+        "failed": failed,
+        "pass_rate": percent(passed, result.total),
+        "adjusted": result.adjusted,
+        "suspicious": result.suspicious_details,
+        "endpoints": total_endpoints,
+        "fully_covered": fully,
+        "endpoint_coverage": percent(fully, total_endpoints),
+        "partly_covered": partly,
+        "partly_endpoint_coverage": percent(partly, total_endpoints),
+        "endpoint_avg_coverage": endpoint_avg,
+        "section_coverage": section_avg,
+        "undeclared_count": len(undeclared),
+        "undeclared_status_codes": percent(len(undeclared), test_count or 1),
+        "undeclared_cases": [
+            {"method": m, "path": path, "code": code, "declared": exp}
+            for m, path, code, exp in undeclared
+        ],
+        "flaky_tests": flaky,
+        "used_status_codes": [
+            {"method": method, "path": path, "codes": sorted(codes)}
+            for (method, path), codes in sorted(used_status_codes.items())
+        ],
+        "coverage_table": rows,
+        "outcomes": {t["nodeid"]: {"outcome": t.get("outcome"), "duration": t.get("duration"),
+                                   "category": result.categories.get(t["nodeid"]),
+                                   "message": failure_message(t)}
+                     for t in report.get("tests", [])},
+    }
+
 
-        # 6) Полное покрытие **по статус-кодам**
-        measure_full_status_coverage(used_status_codes, parsed)
+def store_record(record: dict, db_path: str | None) -> None:
+    # Каждый прогон добавляется в хранилище результатов новой записью
+    if not db_path:
+        return
+    conn = results_store.connect(db_path)
+    try:
+        results_store.record_run(conn, record)
+    finally:
+        conn.close()
 
 
-        # Покрытие по разделам
-        show_status_code_coverage_sec(used_status_codes, parsed)
-        
-        # 5) Частичное покрытие **по endpoint-ам** (метод+путь)
-        measure_api_coverage(used_status_codes, parsed)
-        analyze_unSpecification_status_codes(TEST_FILE, parsed)
+def record_status_codes(record: dict) -> Dict[Tuple[str, str], Set[str]]:
+    # Коды, по которым evaluate_file считал покрытие (статические или из прогона)
+    return {(u["method"], u["path"]): set(u["codes"]) for u in record["used_status_codes"]}
 
-        get_pass_fail_rate_sec(report)
 
+def evaluate_file_to_log(test_file: str, parsed: dict, args: argparse.Namespace) -> dict:
+    """
+    Пишет вывод evaluate_file в vN_metrics_log.txt рядом с файлом тестов,
+    запись с метриками — в vN_metrics.json и в хранилище результатов.
+    Возвращает запись.
+    """
+    log_path = metrics_log_path(test_file)
+    with open(log_path, "w", encoding='utf-8') as log, redirect_stdout(log):
+        record = evaluate_file(test_file, parsed, args)
+    save_metrics_record(test_file, record)
+    store_record(record, args.results_db)
+    return record
 
-        # 4) Таблица по всем status-кодам
-        show_status_code_coverage(used_status_codes, parsed)
-        analyze_unSpecification_status_det(TEST_FILE, parsed)
-        print_pass_fail_details(report)
 
+def run_batch(pattern: str, parsed: dict, args: argparse.Namespace) -> None:
+    """
+    Batch-режим: все файлы по glob-шаблону (например, '*/v*_main.py')
+    оцениваются параллельно, не более args.batch_jobs одновременно.
+    """
+    files = sorted(glob.glob(pattern))
+    if not files:
+        print(f"❌ Нет файлов по шаблону {pattern}")
+        return
+    # Pylint — самый медленный этап: сначала считаем оценки всех файлов параллельно
+    # (с кэшем), затем воркеры evaluate_file берут их из кэша
+    if args.style_cache:
+        score_styles(files, args.batch_jobs, args.style_cache)
+    records: Dict[str, dict] = {}
+    with process_pool(args.batch_jobs) as pool:
+        futures = {pool.submit(evaluate_file_to_log, f, parsed, args): f for f in files}
+        for future in as_completed(futures):
+            try:
+                records[futures[future]] = future.result()
+                print(f"📝 {futures[future]} -> {metrics_log_path(futures[future])}")
+            except Exception as e:
+                print(f"❌ {futures[future]}: {e}")
+    # Сводка по тем же кодам, что и в логах файлов (в т.ч. с --runtime-coverage)
+    done = [f for f in files if f in records]
+    print_batch_coverage(done, spec_index(parsed), [record_status_codes(records[f]) for f in done])
 
-        # Долго, но надежно
-        names = extract_test_names(TEST_FILE)
-        detect_flaky_tests(names)
 
-        print("\n"*3)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Метрики качества сгенерированных тестов")
+    parser.add_argument("files", nargs="*", default=TEST_FILEs, help="Файлы с тестами (по умолчанию TEST_FILEs)")
+    parser.add_argument("--batch", metavar="GLOB",
+                        help="Оценить все файлы по шаблону и записать vN_metrics_log.txt для каждого")
+    parser.add_argument("--batch-jobs", type=int, default=4, help="Число файлов, оцениваемых одновременно")
+    parser.add_argument("--flaky-jobs", type=int, default=1, help="Число процессов для поиска флаки-тестов")
+    parser.add_argument("--flaky-adaptive", action="store_true",
+                        help="Адаптивные повторы с ранней остановкой и уверенностью вердиктов")
+    parser.add_argument("--jobs", type=int, default=1, help="Число процессов для основного прогона pytest")
+    parser.add_argument("--pytest-subprocess", action="store_true",
+                        help="Основной прогон через подпроцесс pytest --json-report вместо in-process")
+    parser.add_argument("--warm-pool", action="store_true",
+                        help="Запускать pytest в форках прогретого форк-сервера вместо новых интерпретаторов")
+    parser.add_argument("--base", help="Ранее оценённая версия: перезапускаются только новые и изменённые тесты")
+    parser.add_argument("--incremental", action="store_true",
+                        help="То же, что --base, с предыдущей версией vN-1_main.py из той же папки")
+    parser.add_argument("--runtime-coverage", action="store_true",
+                        help="Покрытие по статус-кодам по реальным ответам прогона, а не по assert-ам в коде")
+    parser.add_argument("--flaky-cache", default=FLAKY_CACHE_DIR,
+                        help="Каталог кэша вердиктов flaky (пустая строка — без кэша)")
+    parser.add_argument("--style-cache", default=STYLE_CACHE_DIR,
+                        help="Каталог кэша оценок pylint (пустая строка — без кэша)")
+    parser.add_argument("--spec-cache", default=SPEC_CACHE_DIR,
+                        help="Каталог кэша спецификаций (пустая строка — всегда загружать с сервера)")
+    parser.add_argument("--refresh-spec", action="store_true",
+                        help="Заново загрузить спецификацию с сервера и обновить кэш")
+    parser.add_argument("--results-db", default=results_store.RESULTS_DB,
+                        help="SQLite-хранилище результатов всех прогонов (пустая строка — не записывать)")
+    args = parser.parse_args()
+    USE_WARM_POOL = args.warm_pool
+
+    # 1) Получаем и разбираем spec — один раз на все файлы, с локальным кэшем
+    parsed = get_spec(BASE_URL, ENDPOINTS, refresh=args.refresh_spec, cache_dir=args.spec_cache or None)
+
+    if args.batch:
+        run_batch(args.batch, parsed, args)
+    else:
+        for test_file in args.files:
+            print(test_file)
+            record = evaluate_file(test_file, parsed, args)
+            save_metrics_record(test_file, record)
+            store_record(record, args.results_db)
+            print("\n"*3)
@@ -0,0 +1,171 @@
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, List, Tuple
+
+# Хранилище результатов всех прогонов (SQLite, только добавление записей):
+#   runs           — одна строка на оценку файла (модель, версия, время, сводные метрики)
+#   tests          — исход каждого теста прогона
+#   endpoint_codes — факты (endpoint, статус-код): объявлен в spec / получен тестами
+RESULTS_DB = "results.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    model TEXT NOT NULL,
+    version INTEGER,
+    file TEXT NOT NULL,
+    source TEXT NOT NULL,
+    started REAL,
+    duration REAL,
+    recorded REAL NOT NULL,
+    style_score REAL,
+    pass_rate REAL,
+    endpoint_coverage REAL,
+    partly_endpoint_coverage REAL,
+    undeclared_status_codes REAL,
+    cyclomatic_complexity REAL,
+    avg_test_length REAL,
+    avg_requests_per_test REAL,
+    flaky_count INTEGER,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    nodeid TEXT NOT NULL,
+    outcome TEXT,
+    category TEXT,
+    duration REAL,
+    flaky INTEGER NOT NULL DEFAULT 0,
+    message TEXT
+);
+CREATE TABLE IF NOT EXISTS endpoint_codes (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,
+    code TEXT NOT NULL,
+    declared INTEGER NOT NULL,
+    received INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_model_version ON runs(model, version);
+CREATE INDEX IF NOT EXISTS tests_nodeid ON tests(nodeid);
+CREATE INDEX IF NOT EXISTS tests_run ON tests(run_id);
+CREATE INDEX IF NOT EXISTS endpoint_codes_run ON endpoint_codes(run_id);
+CREATE INDEX IF NOT EXISTS endpoint_codes_key ON endpoint_codes(method, path, code);
+"""
+
+# Сводные метрики записи, которые хранятся отдельными столбцами runs
+RUN_METRICS = [
+    "style_score", "pass_rate", "endpoint_coverage", "partly_endpoint_coverage",
+    "undeclared_status_codes", "cyclomatic_complexity", "avg_test_length", "avg_requests_per_test",
+]
+
+
+def connect(db_path: str = RESULTS_DB) -> sqlite3.Connection:
+    # timeout: batch-прогоны и импорт могут писать одновременно
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def file_version(path: str) -> int | None:
+    # Qwen/v8_main.py -> 8
+    m = re.search(r'(?:^|/)v(\d+)_[^/]*$', path.replace(os.sep, "/"))
+    return int(m.group(1)) if m else None
+
+
+def split_codes(text: str) -> List[str]:
+    return [code for code in (text or "").split(",") if code and code != "-"]
+
+
+def endpoint_facts(record: dict) -> Dict[Tuple[str, str, str], List[int]]:
+    """(method, path, code) -> [declared, received] из таблицы покрытия и незаявленных случаев."""
+    facts: Dict[Tuple[str, str, str], List[int]] = {}
+    for row in record.get("coverage_table", []):
+        for code in split_codes(row["Specification"]):
+            facts.setdefault((row["method"], row["path"], code), [0, 0])[0] = 1
+        for code in split_codes(row["Expected"]):
+            facts.setdefault((row["method"], row["path"], code), [0, 0])[1] = 1
+    # Незаявленные коды endpoint-ов, которых нет в spec, в таблицу не попадают
+    for case in record.get("undeclared_cases", []):
+        facts.setdefault((case["method"], case["path"], case["code"]), [0, 0])[1] = 1
+    return facts
+
+
+def record_run(conn: sqlite3.Connection, record: dict, source: str = "metrics") -> int:
+    """
+    Добавляет запись evaluate_file (см. metrics.py) как новый прогон и возвращает его id.
+    Существующие прогоны не изменяются.
+    """
+    flaky = set(record.get("flaky_tests") or [])
+    with conn:
+        cur = conn.execute(
+            f"INSERT INTO runs (model, version, file, source, started, duration, recorded, "
+            f"{', '.join(RUN_METRICS)}, flaky_count, record) "
+            f"VALUES ({', '.join('?' * (len(RUN_METRICS) + 9))})",
+            (
+                record.get("model") or os.path.basename(os.path.dirname(record["file"])),
+                file_version(record["file"]),
+                record["file"],
+                source,
+                record.get("started"),
+                record.get("duration"),
+                time.time(),
+                *(record.get(key) for key in RUN_METRICS),
+                len(flaky),
+                json.dumps(record, ensure_ascii=False),
+            ),
+        )
+        run_id = cur.lastrowid
+        # flaky — по имени тестовой функции, nodeid может содержать путь и параметры
+        conn.executemany(
+            "INSERT INTO tests (run_id, nodeid, outcome, category, duration, flaky, message) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (run_id, nodeid, t.get("outcome"), t.get("category"), t.get("duration"),
+                 int(nodeid.split("::")[-1].split("[")[0] in flaky), t.get("message"))
+                for nodeid, t in record.get("outcomes", {}).items()
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO endpoint_codes (run_id, method, path, code, declared, received) VALUES (?, ?, ?, ?, ?, ?)",
+            [(run_id, *key, declared, received) for key, (declared, received) in endpoint_facts(record).items()],
+        )
+    return run_id
+
+
+def latest_runs(conn: sqlite3.Connection, model: str = None) -> List[sqlite3.Row]:
+    """
+    Один прогон на пару (модель, версия), по возрастанию версии: прогон metrics.py
+    важнее импортированного лога, среди них — самый поздний по started.
+    """
+    where = "WHERE model = ?" if model else ""
+    return conn.execute(
+        f"SELECT * FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY model, version "
+        f"ORDER BY source = 'metrics' DESC, COALESCE(started, 0) DESC, id DESC) AS pos FROM runs {where}) "
+        f"WHERE pos = 1 ORDER BY model, version",
+        (model,) if model else (),
+    ).fetchall()
+
+
+def test_history(conn: sqlite3.Connection, nodeid: str) -> List[sqlite3.Row]:
+    """Исходы одного теста во всех прогонах."""
+    return conn.execute(
+        "SELECT runs.model, runs.version, runs.started, tests.* FROM tests JOIN runs ON runs.id = tests.run_id "
+        "WHERE tests.nodeid = ? ORDER BY runs.id",
+        (nodeid,),
+    ).fetchall()
+
+
+def endpoint_history(conn: sqlite3.Connection, method: str, path: str) -> List[sqlite3.Row]:
+    """Объявленные и полученные коды одного endpoint-а по прогонам."""
+    return conn.execute(
+        "SELECT runs.model, runs.version, endpoint_codes.code, endpoint_codes.declared, endpoint_codes.received "
+        "FROM endpoint_codes JOIN runs ON runs.id = endpoint_codes.run_id "
+        "WHERE endpoint_codes.method = ? AND endpoint_codes.path = ? ORDER BY runs.id, endpoint_codes.code",
+        (method.upper(), path),
+    ).fetchall()
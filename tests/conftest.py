@@ -0,0 +1,5 @@
+import os
+import sys
+
+# metrics.py, results_store.py и import_logs.py лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,30 @@
+import import_logs
+
+# Grok/v6_pytest_log.txt, сокращённо
+PYTEST_LOG = """\
+..F.........F.....F..F........
+FAILED Grok/v6_main.py::test_get_pet_by_id_valid - assert 404 == 200
+FAILED Grok/v6_main.py::test_put_pet_invalid_data - requests.exceptions.RetryError: HTTPSConnectionPool(host='petstore.swagger.io', port=443): Max retries exceeded with url: /v2/pet (Caused by Resp...
+FAILED Grok/v6_main.py::test_delete_pet_valid - assert 404 in [200, 400]
+FAILED Grok/v6_main.py::test_put_user_not_found - assert 200 == 404
+4 failed, 26 passed in 40.09s
+"""
+
+
+def test_pytest_log_summary_and_categories(tmp_path):
+    path = tmp_path / "v6_pytest_log.txt"
+    path.write_text(PYTEST_LOG, encoding="utf-8")
+    record = import_logs.parse_pytest_log(str(path))
+
+    assert record["duration"] == 40.09
+    assert (record["tests"], record["passed"], record["failed"]) == (30, 27, 3)
+    assert record["pass_rate"] == 90.0
+    assert record["adjusted"] == ["Grok/v6_main.py::test_put_user_not_found"]
+    assert record["suspicious"] == ["Grok/v6_main.py::test_get_pet_by_id_valid"]
+    categories = {nodeid.split("::")[1]: t["category"] for nodeid, t in record["outcomes"].items()}
+    assert categories == {
+        "test_get_pet_by_id_valid": "suspicious",
+        "test_put_pet_invalid_data": "failed",
+        "test_delete_pet_valid": "failed",
+        "test_put_user_not_found": "adjusted",
+    }
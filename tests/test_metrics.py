@@ -0,0 +1,119 @@
+import textwrap
+
+import metrics
+
+
+def write_suite(tmp_path, source: str, name: str = "v1_main.py") -> str:
+    path = tmp_path / name
+    path.write_text(textwrap.dedent(source), encoding="utf-8")
+    return str(path)
+
+
+def test_failed_not_in_status_assert_is_classified(tmp_path):
+    suite = write_suite(tmp_path, """
+        class Response:
+            status_code = 200
+
+
+        def test_rejects_invalid_pet():
+            r = Response()
+            assert r.status_code not in [200, 201]
+    """)
+    report = metrics.run_pytest_inprocess(module_path=suite)
+    [test] = report["tests"]
+    assert test["status_asserts"] == [[200, "not in", (200, 201)]]
+
+    result = metrics.classify_report(report)
+    assert result.passed == 0
+    assert result.categories[test["nodeid"]] == "failed"
+
+
+def test_adaptive_reruns_give_noisy_tests_more_runs(tmp_path):
+    suite = write_suite(tmp_path, """
+        import time
+
+        calls = []
+
+
+        def test_quiet():
+            assert True
+
+
+        def test_noisy():
+            # Длительность прыгает между 0 и 0.2 с, исход всегда один
+            calls.append(1)
+            time.sleep(0.2 if len(calls) % 2 else 0)
+    """)
+    outcomes, node_names, durations = metrics.detect_flaky_tests_in_session(
+        ["test_quiet", "test_noisy"], suite, repeat=3, adaptive=True)
+    runs = {node_names[nodeid]: len(results) for nodeid, results in outcomes.items()}
+    assert runs["test_quiet"] == 2
+    assert runs["test_noisy"] > 3
+
+    quiet, noisy = (next(n for n in outcomes if node_names[n] == name) for name in ("test_quiet", "test_noisy"))
+    assert metrics.verdict_confidence(outcomes[noisy], durations[noisy]) < \
+        metrics.verdict_confidence(outcomes[noisy])
+    assert metrics.verdict_confidence(["passed"] * 2) < metrics.verdict_confidence(["passed"] * 5)
+
+
+def test_failure_message_without_status_assert(tmp_path):
+    suite = write_suite(tmp_path, """
+        import pytest
+
+
+        @pytest.fixture
+        def broken():
+            raise RuntimeError("stand is down")
+
+
+        def test_key_error():
+            assert {}["id"]
+
+
+        def test_json_field():
+            data = {"name": "doggie"}
+            assert data["name"] == "cat"
+
+
+        def test_setup_error(broken):
+            pass
+
+
+        def test_ok():
+            pass
+    """)
+    report = metrics.run_pytest_inprocess(module_path=suite)
+    messages = {t["nodeid"].split("::")[1]: metrics.failure_message(t) for t in report["tests"]}
+    assert messages["test_key_error"] == "KeyError: 'id'"
+    assert messages["test_json_field"].startswith("AssertionError: assert 'doggie' == 'cat'")
+    assert messages["test_setup_error"] == "RuntimeError: stand is down"
+    assert messages["test_ok"] is None
+
+
+def test_parallel_report_keeps_collection_order(tmp_path):
+    suite = write_suite(tmp_path, """
+        import pytest
+
+
+        def test_first():
+            pass
+
+
+        class TestPet:
+            def test_create(self):
+                pass
+
+            @pytest.mark.parametrize("pet_id", [1, 2])
+            def test_get(self, pet_id):
+                pass
+
+
+        def test_last():
+            pass
+    """)
+    serial = [t["nodeid"] for t in metrics.run_pytest_inprocess(module_path=suite)["tests"]]
+    parallel = [t["nodeid"] for t in metrics.run_pytest_parallel(suite, jobs=3)["tests"]]
+    assert parallel == serial
+    assert [nodeid.split("::", 1)[1] for nodeid in serial] == [
+        "test_first", "TestPet::test_create", "TestPet::test_get[1]", "TestPet::test_get[2]", "test_last",
+    ]
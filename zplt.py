@@ -2,8 +2,10 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
+import json
 import os
 import re
+import results_store
 
 # Список папок с файлами отчетов
 FOLDERS = [
@@ -21,7 +23,17 @@ METRICS = {
     "endpoint_coverage": r"API Endpoint Coverage:\s*\d+/(\d+)\s*\((\d+\.\d+)%\)",
     "partly_endpoint_coverage": r"API partly Endpoint Coverage\s*[:\s]\s*\d+/(\d+)\s*\((\d+\.\d+)%\)",
     "flaky_tests": r"⚠️?\s*Flaky tests:\s*\[([^\]]*)\]",
-    "undeclared_status_codes": r"❗\s*Незаявленные статус-коды:\s*\d+\s*/\s*(\d+)\s*\((\d+\.\d+)%\)"
+    "undeclared_status_codes": r"❗\s*Незаявленные статус-коды:\s*\d+\s*/\s*(\d+)\s*\((\d+\.\d+)%\)",
+    "cyclomatic_complexity": r"Cyclomatic complexity:\s*(\d+)",
+    "avg_test_length": r"Средняя длина теста:\s*(\d+\.\d+)",
+    "avg_requests_per_test": r"Запросов на тест:\s*(\d+\.\d+)"
+}
+
+# Метрики по AST тестов: в старых логах их нет, поэтому отсутствие не считается ошибкой
+TEST_SIZE_METRICS = {
+    "cyclomatic_complexity": ("Цикломатическая сложность (макс.)", "#B07AA1"),
+    "avg_test_length": ("Средняя длина теста (строк)", "#EDC948"),
+    "avg_requests_per_test": ("Запросов на тест", "#FF9DA7"),
 }
 
 # Папка для сохранения диаграмм
@@ -58,12 +70,16 @@ def parse_report(file_path):
                 elif key == "flaky_tests":
                     tests = match.group(1).strip()
                     data[key] = len(tests.split(',')) if tests else 0
+                elif key in TEST_SIZE_METRICS:
+                    data[key] = float(match.group(1))
                 else:
                     data[key] = float(match.group(2)) if key.endswith("coverage") or key == "pass_rate" or key == "undeclared_status_codes" else int(match.group(1))
                 print(f"  {key}: {data[key]}")
             except (IndexError, ValueError):
                 print(f"Ошибка парсинга метрики {key} в файле {file_path}. Устанавливается 0.")
                 data[key] = 0.0 if key != "flaky_tests" else 0
+        elif key in TEST_SIZE_METRICS:
+            data[key] = 0.0
         else:
             print(f"Метрика {key} не найдена в файле {file_path}. Первые строки файла:")
             for i, line in enumerate(lines[:10], 1):
@@ -76,21 +92,69 @@ def parse_report(file_path):
             data[key] = 0.0 if key != "flaky_tests" else 0
     return data
 
-def collect_data_from_folder(folder):
-    """Сбор данных из файлов в одной папке."""
+def load_record(file_path):
+    """Метрики из vN_metrics.json, записанного metrics.py, — без разбора текста."""
+    with open(file_path, encoding='utf-8') as f:
+        record = json.load(f)
+    data = {key: float(record.get(key) or 0.0) for key in METRICS if key != "flaky_tests"}
+    data["style_score"] *= 10
+    data["flaky_tests"] = len(record.get("flaky_tests") or [])
+    return data
+
+def collect_data_from_folder(folder, skip=()):
+    """
+    Сбор данных из файлов в одной папке: vN_metrics.json, если он есть,
+    иначе разбор текстового vN_metrics_log.txt (старые прогоны).
+    Версии с именами из skip (vN_metrics_log.txt) пропускаются.
+    """
     reports_data = []
     folder_path = folder
     if not os.path.exists(folder_path):
         print(f"Папка {folder_path} не найдена.")
         return reports_data
-    for filename in sorted(os.listdir(folder_path)):
-        if filename.startswith("v") and filename.endswith("_metrics_log.txt"):
-            file_path = os.path.join(folder_path, filename)
+    stems = sorted({
+        filename[:-len(suffix)]
+        for filename in os.listdir(folder_path)
+        for suffix in ("_metrics_log.txt", "_metrics.json")
+        if filename.startswith("v") and filename.endswith(suffix)
+    })
+    for stem in stems:
+        if f"{stem}_metrics_log.txt" in skip:
+            continue
+        file_path = os.path.join(folder_path, f"{stem}_metrics_log.txt")
+        try:
+            data = load_record(os.path.join(folder_path, f"{stem}_metrics.json"))
+        except (FileNotFoundError, json.JSONDecodeError):
             data = parse_report(file_path)
-            data["filename"] = filename
-            reports_data.append(data)
+        data["filename"] = f"{stem}_metrics_log.txt"
+        reports_data.append(data)
     return reports_data
 
+def collect_data_from_store(conn, model):
+    """Последние прогоны каждой версии модели из хранилища результатов (в т.ч. импортированные логи)."""
+    reports_data = []
+    for row in results_store.latest_runs(conn, model):
+        # Прогон без отчёта metrics.py (только лог pytest) на диаграммах не показывается
+        if row["pass_rate"] is None:
+            continue
+        data = {key: float(row[key] or 0.0) for key in results_store.RUN_METRICS}
+        data["style_score"] *= 10
+        data["flaky_tests"] = row["flaky_count"]
+        data["filename"] = f"v{row['version']}_metrics_log.txt"
+        reports_data.append(data)
+    return reports_data
+
+def report_version(data):
+    # v12_metrics_log.txt -> 12
+    m = re.match(r'v(\d+)_', data["filename"])
+    return int(m.group(1)) if m else 0
+
+def collect_data(conn, folder):
+    """Версии из хранилища результатов, остальные — из файлов папки."""
+    stored = collect_data_from_store(conn, os.path.basename(folder)) if conn else []
+    reports_data = stored + collect_data_from_folder(folder, skip={data["filename"] for data in stored})
+    return sorted(reports_data, key=report_version)
+
 def plot_folder_data(folder, reports_data):
     """Генерация горизонтальной диаграммы с наложением для процентных метрик и отдельной для flaky_tests."""
     if not reports_data:
@@ -186,6 +250,35 @@ def plot_folder_data(folder, reports_data):
     plt.close()
     print(f"Диаграмма количественных метрик для папки {folder} сохранена как {output_file}")
 
+    plot_test_size(folder, reports_data)
+
+
+def plot_test_size(folder, reports_data):
+    """Линейная диаграмма метрик размера тестов: сложность, длина, запросы на тест."""
+    if not any(data.get(key, 0.0) for data in reports_data for key in TEST_SIZE_METRICS):
+        return
+
+    labels = [data["filename"] for data in reports_data]
+    fig, ax = plt.subplots(figsize=(14, 6))
+    x = np.arange(len(labels))
+    for key, (label, color) in TEST_SIZE_METRICS.items():
+        values = [data.get(key, 0.0) for data in reports_data]
+        ax.plot(x, values, label=label, color=color, marker='o', linewidth=2)
+
+    ax.grid(True, axis='y', linestyle='--', alpha=0.7)
+    ax.set_axisbelow(True)
+    ax.set_ybound(lower=0)
+    ax.set_ylabel("Значение", fontsize=10)
+    ax.set_xticks(x)
+    ax.set_xticklabels(labels, rotation=45, ha="right", fontsize=8)
+    ax.legend()
+
+    plt.tight_layout(pad=4.0)
+    output_file = os.path.join(OUTPUT_DIR, f"{os.path.basename(folder)}_test_size.png")
+    plt.savefig(output_file, dpi=300)
+    plt.close()
+    print(f"Диаграмма размера тестов для папки {folder} сохранена как {output_file}")
+
 
 
 def plot_models_comparison(all_data):
@@ -274,14 +367,38 @@ def plot_models_comparison(all_data):
     plt.close()
     print(f"Гистограмма flaky_tests сохранена как {output_file}")
 
+    # Метрики размера тестов: отдельная гистограмма на каждую
+    for metric_name, (label, color) in TEST_SIZE_METRICS.items():
+        values = [model_data[model].get(metric_name, 0.0) for model in labels]
+        if not any(values):
+            continue
+        fig, ax = plt.subplots(figsize=(10, 6))
+        x = np.arange(len(labels))
+        ax.bar(x, values, width=0.6, color=color)
+
+        ax.grid(True, axis='y', linestyle='--', alpha=0.7)
+        ax.set_axisbelow(True)
+        ax.set_title(label)
+        ax.set_xticks(x)
+        ax.set_xticklabels(labels, rotation=45, ha="right", fontsize=8)
+
+        plt.tight_layout(pad=4.0)
+        output_file = os.path.join(OUTPUT_DIR, f"models_{metric_name}_comparison.png")
+        plt.savefig(output_file, dpi=300)
+        plt.close()
+        print(f"Сравнительная диаграмма для {metric_name} сохранена как {output_file}")
+
 
 
 
 def main():
     """Основная функция для обработки отчетов и генерации диаграмм."""
     all_data = []
+    # Версии из хранилища результатов (metrics.py, import_logs.py), если оно есть;
+    # версии, которых в нём нет, — из файлов папки
+    conn = results_store.connect(results_store.RESULTS_DB) if os.path.exists(results_store.RESULTS_DB) else None
     for folder in FOLDERS:
-        reports_data = collect_data_from_folder(folder)
+        reports_data = collect_data(conn, folder)
         plot_folder_data(folder, reports_data)
         for data in reports_data:
             data["folder"] = os.path.basename(folder)